@@ -0,0 +1,3 @@
+"""
+This package contains benchmarks for the fake API.
+"""
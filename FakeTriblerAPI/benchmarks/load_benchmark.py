@@ -0,0 +1,301 @@
+"""
+Replays a GUI-like mix of requests against the fake API and reports the throughput and latency per endpoint.
+
+The mix polls the downloads, browses the torrents of discovered channels and runs searches, while a number of clients
+keep the events stream open. Requests are made by a fixed number of concurrent clients, every client sends its next
+request as soon as the previous response has been read completely. The latency of a request is the time until its
+complete response has been received.
+
+By default a fake API with the given profile is started on a free port for the duration of the benchmark, use --url
+to benchmark an API that is already running. The results can be saved as JSON with --output, and compared with the
+results of an earlier run with --compare.
+
+Usage: python -m FakeTriblerAPI.benchmarks.load_benchmark [--profile NAME] [--concurrency N] [--duration SECONDS]
+                                                          [--events N] [--url URL] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib import quote
+
+from twisted.internet import defer, protocol, reactor, task
+from twisted.web.client import Agent, HTTPConnectionPool, readBody
+
+import FakeTriblerAPI
+
+RUN_FAKE_CORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(FakeTriblerAPI.__file__))),
+                                  "run_fake_core.py")
+
+# The number of seconds to wait for a started fake API to answer, generating the largest profiles takes a while
+STARTUP_TIMEOUT = 300
+
+# The requests of the mix, by route, with their relative frequency
+REQUEST_MIX = (
+    ("/downloads", 4),
+    ("/channels/discovered/{cid}/torrents", 3),
+    ("/search", 2),
+)
+
+# The number of items on a page of channel torrents, like the GUI requests them
+PAGE_SIZE = 50
+
+PERCENTILES = (50, 95, 99)
+
+
+def get_free_port():
+    free_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    free_socket.bind(("127.0.0.1", 0))
+    port = free_socket.getsockname()[1]
+    free_socket.close()
+    return port
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Returns the given percentile of the given sorted values, using the nearest rank.
+    """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(rank, 0)]
+
+
+def summarize(latencies, errors, duration):
+    """
+    Returns the throughput and latency statistics, in milliseconds, of the given request latencies in seconds.
+    """
+    latencies = sorted(latencies)
+    summary = {"requests": len(latencies), "errors": errors, "throughput": len(latencies) / duration,
+               "mean": 1000 * sum(latencies) / len(latencies) if latencies else None}
+    for percentile in PERCENTILES:
+        value = get_percentile(latencies, percentile)
+        summary["p%d" % percentile] = 1000 * value if value is not None else None
+    return summary
+
+
+class EventsCounter(protocol.Protocol):
+    """
+    Counts the events received on an events stream.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+
+    def dataReceived(self, data):
+        self.events += data.count('\n')
+        self.bytes += len(data)
+
+    def connectionLost(self, reason=None):
+        pass
+
+
+class LoadGenerator(object):
+
+    def __init__(self, url, concurrency, duration, num_events_streams):
+        self.url = url.rstrip('/')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.num_events_streams = num_events_streams
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = concurrency
+        self.agent = Agent(reactor, pool=self.pool)
+        self.channel_ids = []
+        self.queries = []
+        self.latencies = dict((route, []) for route, _ in REQUEST_MIX)
+        self.errors = dict((route, 0) for route, _ in REQUEST_MIX)
+        self.events_counters = []
+        self.routes = [route for route, weight in REQUEST_MIX for _ in xrange(weight)]
+        self.end_time = None
+
+    def get(self, path):
+        return self.agent.request('GET', (self.url + path).encode('utf-8'))
+
+    @defer.inlineCallbacks
+    def get_json(self, path):
+        response = yield self.get(path)
+        body = yield readBody(response)
+        defer.returnValue(json.loads(body))
+
+    @defer.inlineCallbacks
+    def wait_until_ready(self, timeout=STARTUP_TIMEOUT):
+        start_time = time.time()
+        while True:
+            try:
+                yield self.get_json("/state")
+                return
+            except Exception:
+                if time.time() - start_time > timeout:
+                    raise
+                yield task.deferLater(reactor, 0.5, lambda: None)
+
+    @defer.inlineCallbacks
+    def prepare(self):
+        """
+        Fetches the channels to browse and derives the search queries from their torrents.
+        """
+        channels = (yield self.get_json("/channels/discovered?first=1&last=100"))["channels"]
+        self.channel_ids = [channel["dispersy_cid"] for channel in channels]
+        for channel_id in self.channel_ids[:10]:
+            torrents = (yield self.get_json("/channels/discovered/%s/torrents?first=1&last=%d" %
+                                            (channel_id, PAGE_SIZE)))["torrents"]
+            for torrent in torrents:
+                words = [word for word in torrent["name"].split() if word.isalnum() and len(word) > 2]
+                if words:
+                    self.queries.append(random.choice(words).lower())
+        if not self.queries:
+            self.queries = ["the"]
+
+    def get_request_path(self, route):
+        if route == "/channels/discovered/{cid}/torrents":
+            first = random.choice((1, 1, 1, 1 + PAGE_SIZE, 1 + 2 * PAGE_SIZE))
+            return "/channels/discovered/%s/torrents?first=%d&last=%d" % \
+                   (random.choice(self.channel_ids), first, first + PAGE_SIZE - 1)
+        if route == "/search":
+            return "/search?q=%s" % quote(random.choice(self.queries).encode('utf-8'))
+        return "/downloads?get_peers=1&get_pieces=1"
+
+    @defer.inlineCallbacks
+    def run_client(self):
+        while time.time() < self.end_time:
+            route = random.choice(self.routes)
+            start_time = time.time()
+            try:
+                response = yield self.get(self.get_request_path(route))
+                yield readBody(response)
+                if response.code >= 400:
+                    raise ValueError("status %d" % response.code)
+            except Exception:
+                self.errors[route] += 1
+                continue
+            self.latencies[route].append(time.time() - start_time)
+
+    @defer.inlineCallbacks
+    def open_events_stream(self):
+        response = yield Agent(reactor).request('GET', (self.url + "/events").encode('utf-8'))
+        counter = EventsCounter()
+        response.deliverBody(counter)
+        self.events_counters.append(counter)
+
+    @defer.inlineCallbacks
+    def run(self):
+        """
+        Runs the benchmark and returns its results.
+        """
+        yield self.wait_until_ready()
+        yield self.prepare()
+        yield defer.gatherResults([self.open_events_stream() for _ in xrange(self.num_events_streams)])
+
+        start_time = time.time()
+        self.end_time = start_time + self.duration
+        yield defer.gatherResults([self.run_client() for _ in xrange(self.concurrency)])
+        duration = time.time() - start_time
+
+        for counter in self.events_counters:
+            if counter.transport is not None:
+                counter.transport.stopProducing()
+        yield self.pool.closeCachedConnections()
+
+        endpoints = dict((route, summarize(self.latencies[route], self.errors[route], duration))
+                         for route, _ in REQUEST_MIX)
+        all_latencies = [latency for latencies in self.latencies.itervalues() for latency in latencies]
+        defer.returnValue({
+            "url": self.url,
+            "concurrency": self.concurrency,
+            "duration": duration,
+            "time": time.time(),
+            "endpoints": endpoints,
+            "total": summarize(all_latencies, sum(self.errors.itervalues()), duration),
+            "events": {"streams": len(self.events_counters),
+                       "events": sum(counter.events for counter in self.events_counters),
+                       "bytes": sum(counter.bytes for counter in self.events_counters)},
+        })
+
+
+def format_value(value, unit=""):
+    return "%.1f%s" % (value, unit) if value is not None else "-"
+
+
+def print_results(results, baseline=None):
+    """
+    Prints the statistics per endpoint, with the relative change to the given baseline results if any.
+    """
+    print "%-38s %8s %7s %10s %9s %9s %9s" % ("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms")
+    rows = sorted(results["endpoints"].iteritems()) + [("total", results["total"])]
+    for name, summary in rows:
+        print "%-38s %8d %7d %10s %9s %9s %9s" % (name, summary["requests"], summary["errors"],
+                                                  format_value(summary["throughput"]), format_value(summary["p50"]),
+                                                  format_value(summary["p95"]), format_value(summary["p99"]))
+        baseline_summary = None
+        if baseline is not None:
+            baseline_summary = baseline["total"] if name == "total" else baseline["endpoints"].get(name)
+        if baseline_summary:
+            changes = []
+            for key in ("throughput", "p50", "p95", "p99"):
+                if summary[key] and baseline_summary[key]:
+                    changes.append(format_value(100.0 * (summary[key] / baseline_summary[key] - 1), "%"))
+                else:
+                    changes.append("-")
+            print "%-38s %8s %7s %10s %9s %9s %9s" % ("  vs baseline", "", "", changes[0], changes[1], changes[2],
+                                                      changes[3])
+    print "events: %(events)d events (%(bytes)d bytes) on %(streams)d streams" % results["events"]
+
+
+def start_fake_api(profile, port):
+    command = [sys.executable, RUN_FAKE_CORE_PATH, "--port", str(port)]
+    if profile:
+        command += ["--profile", profile]
+    return subprocess.Popen(command, stdout=open(os.devnull, 'w'))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the throughput and latency of the fake API")
+    parser.add_argument("--profile", help="the profile of the fake API that is started (default: default)")
+    parser.add_argument("--url", help="the URL of a running fake API, instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=10, help="the number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="the number of seconds to run")
+    parser.add_argument("--events", type=int, default=1, help="the number of open events streams")
+    parser.add_argument("--output", help="the file to save the results to as JSON")
+    parser.add_argument("--compare", help="a file with earlier results to compare with")
+    return parser.parse_args(argv)
+
+
+@defer.inlineCallbacks
+def main(_, argv):
+    args = parse_args(argv)
+
+    process = None
+    url = args.url
+    if url is None:
+        port = get_free_port()
+        process = start_fake_api(args.profile, port)
+        url = "http://127.0.0.1:%d" % port
+
+    try:
+        generator = LoadGenerator(url, args.concurrency, args.duration, args.events)
+        results = yield generator.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    results["profile"] = args.profile
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline=baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    task.react(main, [sys.argv[1:]])
@@ -0,0 +1,115 @@
+"""
+Reports the number of bytes used per Torrent, Download and DownloadPeer.
+
+The models are compared against a dictionary-backed equivalent with the same attribute values, which is how these
+models were stored before they were slotted (including a list of booleans for the pieces of a download instead of
+a packed bitfield).
+References to other models, like the torrent of a download or its peers, are not counted as part of an entity.
+
+Usage: python -m FakeTriblerAPI.benchmarks.memory_benchmark [--count N]
+"""
+import argparse
+import sys
+from random import seed
+
+from FakeTriblerAPI.download_simulation import DownloadSimulation
+from FakeTriblerAPI.models.download import Download
+from FakeTriblerAPI.models.download_peer import DownloadPeer
+from FakeTriblerAPI.models.torrent import Torrent
+
+MODEL_CLASSES = (Torrent, Download, DownloadPeer)
+
+
+class DictModel:
+    """
+    An old-style class instance that stores its attributes in a __dict__.
+    """
+    pass
+
+
+def get_slot_values(model):
+    """
+    Returns a dictionary with the values of all slots of the given model. The simulated attributes of a download are
+    stored in the download simulation, the values in its row are counted instead of the simulation itself.
+    """
+    values = dict((name, getattr(model, name)) for name in model.__slots__ if hasattr(model, name))
+    if isinstance(model, Download):
+        del values["simulation"]
+        values.update((name, getattr(model, name)) for name in Download.SIMULATED_ATTRIBUTES)
+    return values
+
+
+def to_dict_model(model):
+    dict_model = DictModel()
+    dict_model.__dict__.update(get_slot_values(model))
+    if isinstance(model, Download):
+        dict_model.has_pieces = [model.has_piece(index) for index in xrange(model.total_pieces)]
+        del dict_model._pieces_base64
+        del dict_model._num_pieces
+        del dict_model.row
+        dict_model.ratio = model.ratio
+    return dict_model
+
+
+def get_size(obj, root=None, seen=None):
+    """
+    Returns the number of bytes used by the given object and everything it references, except for other models,
+    singletons and objects that have already been counted.
+    """
+    if seen is None:
+        seen = set()
+        root = obj
+
+    if id(obj) in seen or obj is None or isinstance(obj, bool):
+        return 0
+    if obj is not root and isinstance(obj, MODEL_CLASSES + (DictModel,)):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(get_size(key, root, seen) + get_size(value, root, seen) for key, value in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(get_size(item, root, seen) for item in obj)
+    elif isinstance(obj, DictModel):
+        size += get_size(obj.__dict__, root, seen)
+    elif isinstance(obj, MODEL_CLASSES):
+        size += sum(get_size(value, root, seen) for value in get_slot_values(obj).itervalues())
+    return size
+
+
+def measure(models):
+    """
+    Returns the average number of bytes per model, both dictionary-backed (before) and slotted (after).
+    """
+    before = sum(get_size(to_dict_model(model)) for model in models)
+    after = sum(get_size(model) for model in models)
+    return float(before) / len(models), float(after) / len(models)
+
+
+def run(count):
+    seed(42)
+    torrents = [Torrent(str(i), '%040x' % i, "Torrent %d" % i, 1024 * i, 'other') for i in xrange(count)]
+    simulation = DownloadSimulation()
+    downloads = [Download(torrent, simulation) for torrent in torrents]
+    peers = [peer for download in downloads for peer in download.peers]
+
+    results = []
+    for name, models in (("Torrent", torrents), ("Download", downloads), ("DownloadPeer", peers)):
+        before, after = measure(models)
+        results.append((name, before, after))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the memory used per model")
+    parser.add_argument("--count", type=int, default=1000, help="the number of torrents and downloads to create")
+    args = parser.parse_args()
+
+    print "%-14s %16s %16s %8s" % ("entity", "before (bytes)", "after (bytes)", "saved")
+    for name, before, after in run(args.count):
+        print "%-14s %16.1f %16.1f %7.1f%%" % (name, before, after, 100 * (1 - after / before))
+
+
+if __name__ == "__main__":
+    main()
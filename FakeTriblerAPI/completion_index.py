@@ -0,0 +1,52 @@
+"""
+This module contains a compact index for completing search terms.
+
+All distinct tokens are kept in a sorted list, so the tokens that start with a prefix form a consecutive range that is
+found with binary search. The tokens in a range are ranked by the number of documents that contain them.
+"""
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+
+# Ranges with more than this many tokens cache their most frequent tokens the first time they are completed, so that
+# completing a short prefix does not rank a large part of the vocabulary on every keystroke.
+LARGE_RANGE_SIZE = 256
+TOP_COMPLETIONS_SIZE = 20
+
+
+class CompletionIndex(object):
+
+    def __init__(self, frequencies):
+        """
+        Builds the index from a dictionary of tokens to their frequency.
+        """
+        self.tokens = sorted(frequencies)
+        self.frequencies = array('I', [frequencies[token] for token in self.tokens])
+        self.top_completions = {}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def get_range(self, prefix):
+        """
+        Returns the start and end position of the tokens that start with the given prefix.
+        """
+        start = bisect_left(self.tokens, prefix)
+        return start, bisect_left(self.tokens, prefix + "\xff", start)
+
+    def rank(self, start, end, limit):
+        positions = nlargest(limit, xrange(start, end), key=self.frequencies.__getitem__)
+        return [self.tokens[position] for position in positions]
+
+    def complete(self, prefix, limit):
+        """
+        Returns at most limit tokens that start with the given prefix, most frequent first.
+        """
+        start, end = self.get_range(prefix)
+        if end - start <= LARGE_RANGE_SIZE or limit > TOP_COMPLETIONS_SIZE:
+            return self.rank(start, end, limit)
+
+        top_completions = self.top_completions.get(prefix)
+        if top_completions is None:
+            top_completions = self.top_completions[prefix] = self.rank(start, end, TOP_COMPLETIONS_SIZE)
+        return top_completions[:limit]
@@ -0,0 +1,268 @@
+"""
+This module contains the simulation that advances the state of the downloads over time.
+
+The state that changes on every tick (status, progress, speeds and totals) is not stored in the downloads themselves
+but in columns with one row per download, and the downloads read their row. A tick updates entire columns with map
+and the functions in the operator module, so the per-download work runs in C rather than in a Python loop. Only the
+few rows that change state on a tick are visited in Python.
+
+Every change to the downloads increases the revision of the simulation. Downloads that transfer data change on every
+tick, so they have the revision of the last tick. Every other row keeps the revision of its last status change and
+removed downloads leave a tombstone, so clients can ask for the changes since a revision they have seen. The status
+changes are also kept in a bounded log, so asking for the recent changes only visits the downloads that changed.
+"""
+from bisect import bisect_right
+from collections import deque
+from itertools import compress, izip, repeat
+from operator import add, gt, mul
+from random import random
+
+from twisted.internet.task import LoopingCall
+
+# The number of seconds between two ticks
+TICK_INTERVAL = 1.0
+
+# Speeds fluctuate around the base speed of a download by at most this factor
+SPEED_FLUCTUATION = 0.25
+MIN_SPEED = 1000.0
+
+# The chance per tick that a download in a transitional state moves on to the next state
+TRANSITION_CHANCE = 0.2
+
+# Indices into DLSTATUS_STRINGS
+DLSTATUS_ALLOCATING_DISKSPACE = 0
+DLSTATUS_WAITING4HASHCHECK = 1
+DLSTATUS_HASHCHECKING = 2
+DLSTATUS_DOWNLOADING = 3
+DLSTATUS_SEEDING = 4
+DLSTATUS_STOPPED = 5
+DLSTATUS_STOPPED_ON_ERROR = 6
+DLSTATUS_METADATA = 7
+DLSTATUS_CIRCUITS = 8
+
+# The state that follows every state, stopped downloads stay stopped until they are resumed
+NEXT_STATUS = [DLSTATUS_WAITING4HASHCHECK, DLSTATUS_HASHCHECKING, DLSTATUS_DOWNLOADING, DLSTATUS_DOWNLOADING,
+               DLSTATUS_SEEDING, DLSTATUS_STOPPED, DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_DOWNLOADING,
+               DLSTATUS_METADATA]
+
+# Whether a download in every state moves on to the next state by chance
+TRANSITIONAL = [1, 1, 1, 0, 0, 0, 0, 1, 1]
+
+# Whether a download in every state is downloading and uploading, as a factor for its speeds
+DOWNLOADING = [0, 0, 0, 1, 0, 0, 0, 0, 0]
+UPLOADING = [0, 0, 0, 1, 1, 0, 0, 0, 0]
+
+# Random numbers are drawn from pools that are refilled every few ticks, since drawing fresh numbers for every download
+# on every tick would cost more than the rest of the tick
+RANDOM_POOL_TICKS = 16
+
+# The number of status changes that is kept in the change log. Asking for the changes since a revision that is older
+# than the log visits all downloads.
+CHANGE_LOG_SIZE = 4096
+
+
+class DownloadSimulation(object):
+    """
+    Advances the status, progress, speeds and totals of all downloads on every tick.
+    """
+
+    # The rates are the base speeds of the rows that are downloading and uploading, and 0 for the other rows
+    COLUMNS = ('status', 'progress', 'base_down_speed', 'base_up_speed', 'down_rate', 'up_rate', 'down_speed',
+               'up_speed', 'total_down', 'total_up', 'inverse_size', 'revisions')
+
+    def __init__(self):
+        self.downloads = []
+        for column in DownloadSimulation.COLUMNS:
+            setattr(self, column, [])
+        self.revision = 0
+        self.tick_revision = 0
+        self.active_downloads = []
+        self.change_log = deque(maxlen=CHANGE_LOG_SIZE)
+        self.change_log_start = 0
+        self.transitional_rows = set()
+        self.removed_revisions = []
+        self.removed_infohashes = []
+        self.chance_pool = []
+        self.fluctuation_pool = []
+        self.pool_ticks = 0
+        self.looping_call = None
+        self.ticks = 0
+
+    def __len__(self):
+        return len(self.downloads)
+
+    def add_row(self, download, status, progress, down_speed, up_speed, total_down, total_up):
+        """
+        Adds a row with the given state for the given download and returns its index.
+        """
+        self.downloads.append(download)
+        self.status.append(status)
+        self.progress.append(float(progress))
+        self.base_down_speed.append(float(max(down_speed, MIN_SPEED)))
+        self.base_up_speed.append(float(max(up_speed, MIN_SPEED)))
+        self.down_rate.append(0.0)
+        self.up_rate.append(0.0)
+        self.down_speed.append(float(down_speed))
+        self.up_speed.append(float(up_speed))
+        self.total_down.append(float(total_down))
+        self.total_up.append(float(total_up))
+        self.inverse_size.append(1.0 / max(download.torrent.length, 1))
+        self.revisions.append(0)
+        row = len(self.downloads) - 1
+        self.update_status(row, status)
+        self.revision += 1
+        self.log_change(row, self.revision)
+        return row
+
+    def log_change(self, row, revision):
+        """
+        Records that the given row changed at the given revision.
+        """
+        self.revisions[row] = revision
+        if len(self.change_log) == self.change_log.maxlen:
+            # The oldest change drops out of the log, so the log no longer covers its revision
+            self.change_log_start = self.change_log[0][0]
+        self.change_log.append((revision, self.downloads[row]))
+
+    def touch(self, row):
+        """
+        Marks the given row as changed outside of a tick.
+        """
+        self.revision += 1
+        self.log_change(row, self.revision)
+
+    def update_status(self, row, status):
+        """
+        Sets the status of the given row and the state that depends on it, without marking the row as changed.
+        """
+        self.status[row] = status
+        self.down_rate[row] = self.base_down_speed[row] * DOWNLOADING[status]
+        self.up_rate[row] = self.base_up_speed[row] * UPLOADING[status]
+        if TRANSITIONAL[status]:
+            self.transitional_rows.add(row)
+        else:
+            self.transitional_rows.discard(row)
+
+    def set_status(self, row, status):
+        self.update_status(row, status)
+        self.touch(row)
+
+    def remove_row(self, row):
+        """
+        Removes the given row by moving the last row in its place, and leaves a tombstone for its download.
+        """
+        self.revision += 1
+        self.removed_revisions.append(self.revision)
+        self.removed_infohashes.append(self.downloads[row].torrent.infohash)
+
+        last_row = len(self.downloads) - 1
+        self.transitional_rows.discard(row)
+        if last_row in self.transitional_rows:
+            self.transitional_rows.remove(last_row)
+            self.transitional_rows.add(row)
+        for column in ('downloads',) + DownloadSimulation.COLUMNS:
+            values = getattr(self, column)
+            values[row] = values[last_row]
+            values.pop()
+        if row != last_row:
+            self.downloads[row].row = row
+
+    def refill_pools(self):
+        """
+        Makes sure that the random pools hold at least two random numbers for every row. Every tick uses a slice of
+        these pools at a random offset.
+        """
+        num_rows = len(self.downloads)
+        if len(self.chance_pool) < 2 * num_rows or self.pool_ticks >= RANDOM_POOL_TICKS:
+            self.chance_pool = [random() for _ in xrange(2 * num_rows)]
+            self.fluctuation_pool = [1 + SPEED_FLUCTUATION * (2 * chance - 1) for chance in reversed(self.chance_pool)]
+            self.pool_ticks = 0
+        self.pool_ticks += 1
+
+    def tick(self, interval=TICK_INTERVAL):
+        """
+        Advances all downloads by the given number of seconds.
+        """
+        num_rows = len(self.downloads)
+        if not num_rows:
+            return
+        self.ticks += 1
+        self.refill_pools()
+        offset = int(random() * num_rows)
+        chances = self.chance_pool[offset:offset + num_rows]
+        fluctuation = self.fluctuation_pool[offset:offset + num_rows]
+
+        # Downloads that transfer data change on every tick, the other rows only change when their status changes
+        self.revision += 1
+        self.tick_revision = revision = self.revision
+
+        # Finish the downloads that have all data. Their progress is set to exactly 1, so seeding downloads are not
+        # found again on the next tick. Downloads that have been stopped after passing 1 are left alone.
+        for row in compress(xrange(num_rows), map(gt, self.progress, repeat(1.0, num_rows))):
+            if self.status[row] == DLSTATUS_DOWNLOADING:
+                self.progress[row] = 1.0
+                self.update_status(row, DLSTATUS_SEEDING)
+                self.log_change(row, revision)
+
+        # Move a random part of the downloads in a transitional state to their next state
+        for row in [row for row in self.transitional_rows if chances[row] < TRANSITION_CHANCE]:
+            self.update_status(row, NEXT_STATUS[self.status[row]])
+            self.log_change(row, revision)
+        self.active_downloads = list(compress(self.downloads, self.up_rate))
+
+        # Fluctuate the speeds around the base speeds, only active downloads have a speed
+        self.down_speed = map(mul, self.down_rate, fluctuation)
+        self.up_speed = map(mul, self.up_rate, fluctuation[::-1])
+
+        # Transfer data
+        transferred_down = self.down_speed
+        transferred_up = self.up_speed
+        if interval != 1:
+            transferred_down = map(mul, transferred_down, repeat(float(interval), num_rows))
+            transferred_up = map(mul, transferred_up, repeat(float(interval), num_rows))
+        self.total_down = map(add, self.total_down, transferred_down)
+        self.total_up = map(add, self.total_up, transferred_up)
+        self.progress = map(add, self.progress, map(mul, transferred_down, self.inverse_size))
+
+    def get_changes(self, since):
+        """
+        Returns the downloads that changed after the given revision and the infohashes of the downloads that have been
+        removed after it.
+        """
+        changed_on_tick = since < self.tick_revision
+        removed = self.removed_infohashes[bisect_right(self.removed_revisions, since):]
+        if since < self.change_log_start:
+            changed = [download for download, row_revision, up_rate in izip(self.downloads, self.revisions, self.up_rate)
+                       if row_revision > since or (changed_on_tick and up_rate)]
+            return changed, removed
+
+        changed = []
+        seen = set()
+        for revision, download in reversed(self.change_log):
+            if revision <= since:
+                break
+            if id(download) not in seen:
+                seen.add(id(download))
+                changed.append(download)
+        if changed_on_tick:
+            changed.extend(download for download in self.active_downloads if id(download) not in seen)
+        if removed:
+            # The log and the active downloads of the last tick can hold downloads that have been removed since
+            changed = [download for download in changed if self.contains(download)]
+        return changed, removed
+
+    def contains(self, download):
+        return download.row < len(self.downloads) and self.downloads[download.row] is download
+
+    def start(self, interval=TICK_INTERVAL):
+        """
+        Starts ticking on the reactor every interval seconds.
+        """
+        if self.looping_call is None:
+            self.looping_call = LoopingCall(self.tick, interval)
+            self.looping_call.start(interval, now=False)
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
@@ -4,6 +4,9 @@ from random import sample
 from twisted.web import http, resource
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
+from FakeTriblerAPI.tribler_data import CHANNEL_SORT_KEYS, TORRENT_SORT_KEYS
+from FakeTriblerAPI.json_producer import render_json_list
+from FakeTriblerAPI.utils import encode_json_list, iter_page
 
 
 class BaseChannelsEndpoint(resource.Resource):
@@ -16,6 +19,46 @@ class BaseChannelsEndpoint(resource.Resource):
         request.setResponseCode(http.NOT_FOUND)
         return json.dumps({"error": message})
 
+    @staticmethod
+    def return_400(request, message):
+        request.setResponseCode(http.BAD_REQUEST)
+        return json.dumps({"error": message})
+
+    @staticmethod
+    def get_page_parameters(request, sort_keys):
+        """
+        Returns the first and last position (1-based and inclusive), the sort key and whether to sort descending,
+        as requested with the first, last, sort_by and sort_desc parameters. By default all items are returned in
+        their natural order, in which case last is None. Raises a ValueError with a message for the client if a
+        parameter is invalid.
+        """
+        try:
+            first = int(request.args['first'][0]) if 'first' in request.args else 1
+            last = int(request.args['last'][0]) if 'last' in request.args else None
+        except ValueError:
+            raise ValueError("first and last should be numbers")
+        if first < 1 or (last is not None and last < first - 1):
+            raise ValueError("first should be at least 1 and last should not be smaller than first")
+
+        sort_by = request.args['sort_by'][0] if 'sort_by' in request.args else None
+        if sort_by is not None and sort_by not in sort_keys:
+            raise ValueError("sort_by should be one of %s" % ", ".join(sorted(sort_keys)))
+        sort_desc = 'sort_desc' in request.args and request.args['sort_desc'][0] == "1"
+
+        return first, last, sort_by, sort_desc
+
+    @staticmethod
+    def render_page(request, key, order, first, last, descending, get_fragment):
+        """
+        Renders the JSON encoding of the requested page of the given order of indices, together with the positions of
+        the page and the total number of items. Large pages are streamed.
+        """
+        last = len(order) if last is None else min(last, len(order))
+        # A page beyond the end is empty, which is encoded as last = first - 1 like an empty page that was requested
+        first = min(first, last + 1)
+        return render_json_list(request, key, iter_page(order, first, last, descending=descending),
+                                max(last - first + 1, 0), get_fragment, first=first, last=last, total=len(order))
+
 
 class ChannelsEndpoint(BaseChannelsEndpoint):
 
@@ -34,10 +77,13 @@ class ChannelsSubscribedEndpoint(resource.Resource):
         return ChannelsModifySubscriptionEndpoint(path)
 
     def render_GET(self, request):
+        if request.setETag(tribler_utils.tribler_data.get_etag("subscribed_channels")) == http.CACHED:
+            return ""
+
         subscribed = []
         for channel_id in tribler_utils.tribler_data.subscribed_channels:
-            subscribed.append(tribler_utils.tribler_data.channels[channel_id].get_json())
-        return json.dumps({"subscribed": subscribed})
+            subscribed.append(tribler_utils.tribler_data.channels[channel_id].get_json_fragment())
+        return encode_json_list("subscribed", subscribed)
 
 
 class ChannelsModifySubscriptionEndpoint(BaseChannelsEndpoint):
@@ -57,8 +103,7 @@ class ChannelsModifySubscriptionEndpoint(BaseChannelsEndpoint):
             request.setResponseCode(http.CONFLICT)
             return json.dumps({"error": "you are already subscribed to this channel"})
 
-        tribler_utils.tribler_data.subscribed_channels.add(channel.id)
-        channel.subscribed = True
+        tribler_utils.tribler_data.subscribe_channel(channel)
 
         return json.dumps({"subscribed": True})
 
@@ -73,8 +118,7 @@ class ChannelsModifySubscriptionEndpoint(BaseChannelsEndpoint):
             return ChannelsModifySubscriptionEndpoint.return_404(request,
                                                                  message="you are not subscribed to this channel")
 
-        tribler_utils.tribler_data.subscribed_channels.remove(channel.id)
-        channel.subscribed = False
+        tribler_utils.tribler_data.unsubscribe_channel(channel)
 
         return json.dumps({"unsubscribed": True})
 
@@ -85,10 +129,21 @@ class ChannelsDiscoveredEndpoint(resource.Resource):
         return ChannelsDiscoveredSpecificEndpoint(path)
 
     def render_GET(self, request):
-        channels = []
-        for channel in tribler_utils.tribler_data.channels:
-            channels.append(channel.get_json())
-        return json.dumps({"channels": channels}, ensure_ascii=False)
+        try:
+            first, last, sort_by, sort_desc = BaseChannelsEndpoint.get_page_parameters(request, CHANNEL_SORT_KEYS)
+        except ValueError as error:
+            return BaseChannelsEndpoint.return_400(request, str(error))
+
+        if request.setETag(tribler_utils.tribler_data.get_etag("channels")) == http.CACHED:
+            return ""
+
+        all_channels = tribler_utils.tribler_data.channels
+        order = xrange(len(all_channels))
+        if sort_by is not None:
+            order = tribler_utils.tribler_data.get_sorted_channels(sort_by)
+
+        return BaseChannelsEndpoint.render_page(request, "channels", order, first, last, sort_desc,
+                                                lambda index: all_channels[index].get_json_fragment())
 
 
 class ChannelsDiscoveredSpecificEndpoint(BaseChannelsEndpoint):
@@ -113,14 +168,18 @@ class ChannelTorrentsEndpoint(BaseChannelsEndpoint):
         if channel is None:
             return ChannelsModifySubscriptionEndpoint.return_404(request)
 
-        results_json = []
-        for torrent in channel.torrents:
-            torrent_json = torrent.get_json()
-            if tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"] and torrent_json["category"] == 'xxx':
-                continue
-            results_json.append(torrent_json)
+        try:
+            first, last, sort_by, sort_desc = BaseChannelsEndpoint.get_page_parameters(request, TORRENT_SORT_KEYS)
+        except ValueError as error:
+            return BaseChannelsEndpoint.return_400(request, str(error))
+
+        all_torrents = tribler_utils.tribler_data.torrents
+        family_filter = tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"]
+        order = tribler_utils.tribler_data.get_sorted_channel_torrents(channel, sort_by=sort_by,
+                                                                        family_filter=family_filter)
 
-        return json.dumps({"torrents": results_json})
+        return BaseChannelsEndpoint.render_page(request, "torrents", order, first, last, sort_desc,
+                                                lambda index: all_torrents[index].get_json_fragment())
 
 
 class ChannelPlaylistsEndpoint(BaseChannelsEndpoint):
@@ -139,9 +198,9 @@ class ChannelPlaylistsEndpoint(BaseChannelsEndpoint):
 
         playlists = []
         for playlist in channel.playlists:
-            playlists.append(playlist.get_json())
+            playlists.append(playlist.get_json_fragment())
 
-        return json.dumps({"playlists": playlists})
+        return encode_json_list("playlists", playlists)
 
     def render_PUT(self, request):
         channel = tribler_utils.tribler_data.get_channel_with_cid(self.cid)
@@ -237,8 +296,9 @@ class ChannelsModifyPlaylistTorrentsEndpoint(BaseChannelsEndpoint):
 class ChannelsPopularEndpoint(BaseChannelsEndpoint):
 
     def render_GET(self, request):
-        results_json = [channel.get_json() for channel in sample(tribler_utils.tribler_data.channels, 20)]
-        return json.dumps({"channels": results_json})
+        channels = tribler_utils.tribler_data.channels
+        results_json = [channel.get_json_fragment() for channel in sample(channels, min(20, len(channels)))]
+        return encode_json_list("channels", results_json)
 
 
 class ChannelRssFeedsEndpoint(BaseChannelsEndpoint):
@@ -1,18 +1,31 @@
 import json
 
 import time
-from twisted.web import resource
+from twisted.internet import reactor
+from twisted.web import http, resource, server
+
+from FakeTriblerAPI.sampling_profiler import SamplingProfiler
+
+# The default and maximum number of seconds to profile for
+PROFILE_DURATION = 5
+MAX_PROFILE_DURATION = 60
+
+# The number of functions to return by self time
+NUM_TOP_FUNCTIONS = 30
 
 
 class DebugEndpoint(resource.Resource):
 
-    def __init__(self):
+    def __init__(self, events_endpoint, resource_monitor):
         resource.Resource.__init__(self)
+        self.putChild("events", DebugEventsEndpoint(events_endpoint))
+        self.putChild("metrics", DebugMetricsEndpoint())
+        self.putChild("profile", DebugProfileEndpoint())
         self.putChild("open_files", DebugOpenFilesEndpoint())
         self.putChild("open_sockets", DebugOpenSocketsEndpoint())
         self.putChild("threads", DebugThreadsEndpoint())
-        self.putChild("cpu", DebugCPUEndpoint())
-        self.putChild("memory", DebugMemoryEndpoint())
+        self.putChild("cpu", DebugCPUEndpoint(resource_monitor))
+        self.putChild("memory", DebugMemoryEndpoint(resource_monitor))
         self.putChild("log", DebugLogEndpoint())
 
 
@@ -42,14 +55,50 @@ class DebugThreadsEndpoint(resource.Resource):
 
 class DebugCPUEndpoint(resource.Resource):
 
-    def __init__(self):
+    def __init__(self, resource_monitor):
         resource.Resource.__init__(self)
-        self.putChild("history", DebugCPUHistoryEndpoint())
+        self.putChild("history", DebugCPUHistoryEndpoint(resource_monitor))
+
+
+def get_max_points(request):
+    """
+    Returns the maximum number of points of a history as requested with the max_points parameter, None for all points.
+    Raises a ValueError if the parameter is not a positive number.
+    """
+    if 'max_points' not in request.args:
+        return None
+    max_points = int(request.args['max_points'][0])
+    if max_points < 1:
+        raise ValueError()
+    return max_points
+
+
+def render_history(request, key, get_history):
+    """
+    Renders the history of the resource monitor that is returned by get_history, downsampled to the requested number of
+    points.
+    """
+    try:
+        max_points = get_max_points(request)
+    except ValueError:
+        request.setResponseCode(http.BAD_REQUEST)
+        return json.dumps({"error": "max_points should be a positive number"})
+    return json.dumps({key: get_history(max_points=max_points)})
 
 
 class DebugCPUHistoryEndpoint(resource.Resource):
+    """
+    Returns the CPU usage sampled by the resource monitor, or a fixed history if the monitor is not running.
+    """
+
+    def __init__(self, resource_monitor):
+        resource.Resource.__init__(self)
+        self.resource_monitor = resource_monitor
 
     def render_GET(self, request):
+        if self.resource_monitor.running:
+            return render_history(request, "cpu_history", self.resource_monitor.get_cpu_history)
+
         now = time.time()
         return json.dumps({"cpu_history": [
             {"time": now, "cpu": 5.3},
@@ -63,14 +112,24 @@ class DebugCPUHistoryEndpoint(resource.Resource):
 
 class DebugMemoryEndpoint(resource.Resource):
 
-    def __init__(self):
+    def __init__(self, resource_monitor):
         resource.Resource.__init__(self)
-        self.putChild("history", DebugMemoryHistoryEndpoint())
+        self.putChild("history", DebugMemoryHistoryEndpoint(resource_monitor))
 
 
 class DebugMemoryHistoryEndpoint(resource.Resource):
+    """
+    Returns the memory use sampled by the resource monitor, or a fixed history if the monitor is not running.
+    """
+
+    def __init__(self, resource_monitor):
+        resource.Resource.__init__(self)
+        self.resource_monitor = resource_monitor
 
     def render_GET(self, request):
+        if self.resource_monitor.running:
+            return render_history(request, "memory_history", self.resource_monitor.get_memory_history)
+
         now = time.time()
         return json.dumps({"memory_history": [
             {"time": now, "mem": 5000},
@@ -87,3 +146,101 @@ class DebugLogEndpoint(resource.Resource):
     def render_GET(self, request):
         sample_logs = ''.join(["Sample log [%d]\n" % i for i in xrange(10)])
         return json.dumps({"content": sample_logs, "max_lines": 10})
+
+
+class DebugEventsEndpoint(resource.Resource):
+    """
+    Exposes the flush counters of the events endpoint, to tune the trade-off between event latency and throughput.
+    """
+
+    def __init__(self, events_endpoint):
+        resource.Resource.__init__(self)
+        self.events_endpoint = events_endpoint
+
+    def render_GET(self, request):
+        return json.dumps({"events": self.events_endpoint.get_statistics()})
+
+
+class DebugMetricsEndpoint(resource.Resource):
+    """
+    Exposes the request counts, response bytes and latency histograms per route, as kept by a MetricsSite. The metrics
+    are reset with a DELETE request, or after returning them when the reset parameter is 1.
+    """
+
+    @staticmethod
+    def get_metrics(request):
+        metrics = getattr(request.site, "metrics", None)
+        if metrics is None:
+            request.setResponseCode(http.NOT_FOUND)
+        return metrics
+
+    def render_GET(self, request):
+        metrics = DebugMetricsEndpoint.get_metrics(request)
+        if metrics is None:
+            return json.dumps({"error": "the metrics are not kept by this site"})
+
+        response = json.dumps({"metrics": metrics.to_dictionary()})
+        if 'reset' in request.args and request.args['reset'][0] == "1":
+            metrics.reset()
+        return response
+
+    def render_DELETE(self, request):
+        metrics = DebugMetricsEndpoint.get_metrics(request)
+        if metrics is None:
+            return json.dumps({"error": "the metrics are not kept by this site"})
+
+        metrics.reset()
+        return json.dumps({"reset": True})
+
+
+class DebugProfileEndpoint(resource.Resource):
+    """
+    Profiles the fake API with a sampling profiler for the number of seconds given by the duration parameter, while it
+    keeps serving other requests. Returns the collapsed stacks and the functions with the highest self time, or only
+    the collapsed stacks as text when format is collapsed.
+    """
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.profiler = None
+
+    def render_GET(self, request):
+        if self.profiler is not None and self.profiler.running:
+            request.setResponseCode(http.CONFLICT)
+            return json.dumps({"error": "a profile is already being made"})
+
+        try:
+            duration = float(request.args['duration'][0]) if 'duration' in request.args else PROFILE_DURATION
+        except ValueError:
+            duration = -1
+        if not 0 < duration <= MAX_PROFILE_DURATION:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "duration should be a number of seconds up to %d" % MAX_PROFILE_DURATION})
+        collapsed = 'format' in request.args and request.args['format'][0] == "collapsed"
+
+        profiler = self.profiler = SamplingProfiler()
+        profiler.start()
+        finish_call = reactor.callLater(duration, self.finish_profile, request, profiler, collapsed)
+        request.notifyFinish().addErrback(lambda _: self.cancel_profile(profiler, finish_call))
+        return server.NOT_DONE_YET
+
+    @staticmethod
+    def finish_profile(request, profiler, collapsed):
+        profiler.stop()
+        if collapsed:
+            request.setHeader('Content-Type', 'text/plain')
+            request.write(profiler.get_collapsed_stacks())
+        else:
+            request.write(json.dumps({"profile": {
+                "duration": profiler.stop_time - profiler.start_time,
+                "samples": profiler.num_samples,
+                "sample_time": profiler.get_sample_time(),
+                "top_functions": profiler.get_top_functions(NUM_TOP_FUNCTIONS),
+                "collapsed_stacks": profiler.get_collapsed_stacks()}}))
+        request.finish()
+
+    @staticmethod
+    def cancel_profile(profiler, finish_call):
+        if finish_call.active():
+            finish_call.cancel()
+        profiler.stop()
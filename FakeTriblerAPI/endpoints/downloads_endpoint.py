@@ -4,6 +4,7 @@ import json
 from twisted.web import http, resource
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
+from FakeTriblerAPI.models.download import Download
 
 
 class DownloadsEndpoint(resource.Resource):
@@ -22,8 +23,34 @@ class DownloadsEndpoint(resource.Resource):
                 and request.args['get_pieces'][0] == "1":
             get_pieces = True
 
-        return json.dumps({"downloads": [download.get_json(get_peers=get_peers, get_pieces=get_pieces)
-                                         for download in tribler_utils.tribler_data.downloads]})
+        # Only the comma-separated fields are returned, for instance fields=name,infohash,progress
+        fields = None
+        if 'fields' in request.args:
+            fields = [field for value in request.args['fields'] for field in value.split(',') if field]
+
+        try:
+            projection = Download.get_projection(fields)
+        except ValueError as error:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": str(error)})
+
+        # Only the downloads that changed or have been removed after the given revision are returned
+        simulation = tribler_utils.tribler_data.download_simulation
+        downloads = tribler_utils.tribler_data.downloads
+        removed = []
+        if 'since' in request.args:
+            try:
+                since = int(request.args['since'][0])
+            except ValueError:
+                request.setResponseCode(http.BAD_REQUEST)
+                return json.dumps({"error": "since should be a revision number"})
+            downloads, removed = simulation.get_changes(since)
+
+        result = {"downloads": [download.get_json(get_peers=get_peers, get_pieces=get_pieces, projection=projection)
+                                for download in downloads], "revision": simulation.revision}
+        if 'since' in request.args:
+            result["removed"] = removed
+        return json.dumps(result)
 
     def render_PUT(self, request):
         headers = request.getAllHeaders()
@@ -45,6 +72,9 @@ class DownloadEndpoint(resource.Resource):
 
     def render_PATCH(self, request):
         download = tribler_utils.tribler_data.get_download_with_infohash(self.infohash)
+        if download is None:
+            return DownloadBaseEndpoint.return_404(request)
+
         parameters = http.parse_qs(request.content.read(), 1)
 
         if 'selected_files[]' in parameters:
@@ -65,6 +95,15 @@ class DownloadEndpoint(resource.Resource):
 
         return json.dumps({"modified": True, "infohash": self.infohash})
 
+    def render_DELETE(self, request):
+        download = tribler_utils.tribler_data.get_download_with_infohash(self.infohash)
+        if download is None:
+            return DownloadBaseEndpoint.return_404(request)
+
+        tribler_utils.tribler_data.remove_download(download)
+
+        return json.dumps({"removed": True, "infohash": self.infohash})
+
 
 class DownloadBaseEndpoint(resource.Resource):
 
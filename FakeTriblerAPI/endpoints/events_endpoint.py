@@ -1,28 +1,182 @@
 import json
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
 from twisted.web import server, resource
+from zope.interface import implementer
+
+# What to do with a subscriber that does not keep up with the events: drop the events that do not fit in its buffer
+# or disconnect it.
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+SLOW_SUBSCRIBER_POLICY = POLICY_DROP
+
+# The maximum number of bytes that are buffered for a subscriber while its connection is congested
+MAX_SUBSCRIBER_BUFFER_SIZE = 1024 * 1024
+
+# Events are coalesced into a single write per subscriber. Pending events are flushed when they reach this number of
+# bytes, or otherwise this many seconds after the first pending event.
+FLUSH_SIZE = 16 * 1024
+FLUSH_INTERVAL = 0.01
+
+
+@implementer(IPushProducer)
+class EventSubscriber(object):
+    """
+    A client connected to the events endpoint. Events are collected and flushed to the client in a single write.
+    The subscriber is registered as the producer of its request, so it is paused when the transport buffer of the
+    client fills up. Flushed events are buffered while paused and written on resume.
+    """
+
+    def __init__(self, request, policy=SLOW_SUBSCRIBER_POLICY, max_buffer_size=MAX_SUBSCRIBER_BUFFER_SIZE,
+                 statistics=None):
+        self.request = request
+        self.policy = policy
+        self.max_buffer_size = max_buffer_size
+        self.statistics = statistics if statistics is not None else EventsEndpoint.create_statistics()
+        self.pending = []
+        self.pending_size = 0
+        self.flush_call = None
+        self.buffer = []
+        self.buffer_size = 0
+        self.paused = False
+        self.closed = False
+        self.dropped_events = 0
+
+        request.registerProducer(self, True)
+
+    def write(self, data):
+        if self.closed:
+            return
+
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= FLUSH_SIZE:
+            self.flush()
+        elif self.flush_call is None:
+            self.flush_call = reactor.callLater(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """
+        Writes all pending events to the client at once.
+        """
+        if self.flush_call is not None:
+            if self.flush_call.active():
+                self.flush_call.cancel()
+            self.flush_call = None
+        if not self.pending or self.closed:
+            return
+
+        num_events = len(self.pending)
+        data = "".join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+
+        if not self.paused:
+            self.request.write(data)
+        elif self.buffer_size + len(data) <= self.max_buffer_size:
+            self.buffer.append(data)
+            self.buffer_size += len(data)
+        elif self.policy == POLICY_DISCONNECT:
+            self.close()
+            return
+        else:
+            self.dropped_events += num_events
+            self.statistics["dropped_events"] += num_events
+            return
+
+        self.statistics["flushes"] += 1
+        self.statistics["events"] += num_events
+        self.statistics["bytes"] += len(data)
+
+    def close(self):
+        self.stopProducing()
+        self.request.loseConnection()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.buffer and not self.closed:
+            data = "".join(self.buffer)
+            self.buffer = []
+            self.buffer_size = 0
+            self.request.write(data)
+
+    def stopProducing(self):
+        self.closed = True
+        self.pending = []
+        self.pending_size = 0
+        self.buffer = []
+        self.buffer_size = 0
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
 
 
 class EventsEndpoint(resource.Resource):
 
     isLeaf = True
 
-    def __init__(self):
+    def __init__(self, policy=SLOW_SUBSCRIBER_POLICY, max_buffer_size=MAX_SUBSCRIBER_BUFFER_SIZE):
         resource.Resource.__init__(self)
-        self.event_request = None
+        self.policy = policy
+        self.max_buffer_size = max_buffer_size
+        self.subscribers = []
+        self.statistics = EventsEndpoint.create_statistics()
+
+    @staticmethod
+    def create_statistics():
+        return {"flushes": 0, "events": 0, "bytes": 0, "dropped_events": 0}
+
+    def get_statistics(self):
+        """
+        Returns the flush counters of all subscribers so far, including the average number of events and bytes per
+        flush.
+        """
+        statistics = dict(self.statistics)
+        flushes = max(statistics["flushes"], 1)
+        statistics["subscribers"] = len(self.subscribers)
+        statistics["events_per_flush"] = float(statistics["events"]) / flushes
+        statistics["bytes_per_flush"] = float(statistics["bytes"]) / flushes
+        return statistics
+
+    def write_event(self, data):
+        """
+        Writes the given encoded event to every subscriber.
+        """
+        # Iterate over a copy, since a subscriber can be disconnected while writing
+        for subscriber in tuple(self.subscribers):
+            subscriber.write(data)
 
     def on_search_results_channels(self, results):
+        """
+        Writes a search result event for every given JSON encoded channel.
+        """
         for result in results:
-            self.event_request.write(json.dumps({"type": "search_result_channel", "event": {"result": result}}) + '\n')
+            self.write_event('{"type": "search_result_channel", "event": {"result": %s}}\n' % result)
 
     def on_search_results_torrents(self, results):
+        """
+        Writes a search result event for every given JSON encoded torrent.
+        """
         for result in results:
-            self.event_request.write(json.dumps({"type": "search_result_torrent", "event": {"result": result}}) + '\n')
+            self.write_event('{"type": "search_result_torrent", "event": {"result": %s}}\n' % result)
+
+    def remove_subscriber(self, subscriber):
+        subscriber.stopProducing()
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
 
     def render_GET(self, request):
-        self.event_request = request
+        subscriber = EventSubscriber(request, policy=self.policy, max_buffer_size=self.max_buffer_size,
+                                     statistics=self.statistics)
+        self.subscribers.append(subscriber)
+        request.notifyFinish().addBoth(lambda _: self.remove_subscriber(subscriber))
 
-        request.write(json.dumps({"type": "events_start", "event": {"tribler_started": True,
-                                                                    "version": "1.2.3"}}) + '\n')
-        request.write(json.dumps({"type": "tribler_started"}) + '\n')
+        subscriber.write(json.dumps({"type": "events_start", "event": {"tribler_started": True,
+                                                                       "version": "1.2.3"}}) + '\n')
+        subscriber.write(json.dumps({"type": "tribler_started"}) + '\n')
+        subscriber.flush()
 
         return server.NOT_DONE_YET
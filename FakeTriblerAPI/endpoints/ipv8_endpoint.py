@@ -1,7 +1,8 @@
 import json
-from twisted.web import resource
+from twisted.web import http, resource
 
 from FakeTriblerAPI import tribler_utils
+from FakeTriblerAPI.json_producer import render_json_list
 
 
 class IPv8Endpoint(resource.Resource):
@@ -36,7 +37,10 @@ class IPv8TrustChainSpecificUserEndpoint(resource.Resource):
 class IPv8TrustChainSpecificUserBlocksEndpoint(resource.Resource):
 
     def render_GET(self, request):
-        return json.dumps({"blocks": [block.to_dictionary() for block in tribler_utils.tribler_data.trustchain_blocks]})
+        if request.setETag(tribler_utils.tribler_data.get_etag("trustchain_blocks")) == http.CACHED:
+            return ""
+        blocks = tribler_utils.tribler_data.trustchain_blocks
+        return render_json_list(request, "blocks", blocks, len(blocks), lambda block: json.dumps(block.to_dictionary()))
 
 
 class IPv8TunnelEndpoint(resource.Resource):
@@ -35,9 +35,9 @@ class MyChannelEndpoint(MyChannelBaseEndpoint):
         channel_name = parameters['name'][0]
         channel_description = parameters['description'][0]
 
-        my_channel = Channel(len(tribler_utils.tribler_data.channels) - 1,
+        my_channel = Channel(len(tribler_utils.tribler_data.channels),
                              name=channel_name, description=channel_description)
-        tribler_utils.tribler_data.channels.append(my_channel)
+        tribler_utils.tribler_data.add_channel(my_channel)
         tribler_utils.tribler_data.my_channel = my_channel.id
 
         return json.dumps({"added": my_channel.id})
@@ -48,8 +48,7 @@ class MyChannelEndpoint(MyChannelBaseEndpoint):
             return MyChannelBaseEndpoint.return_404(request)
 
         parameters = http.parse_qs(request.content.read(), 1)
-        my_channel.name = parameters['name'][0]
-        my_channel.description = parameters['description'][0]
+        tribler_utils.tribler_data.edit_channel(my_channel, parameters['name'][0], parameters['description'][0])
 
         return json.dumps({"edited": my_channel.id})
 
@@ -63,8 +62,10 @@ class MyChannelTorrentsEndpoint(resource.Resource):
             return "your channel has not been created"
 
         request.setHeader('Content-Type', 'text/json')
+        all_torrents = tribler_utils.tribler_data.torrents
         torrent_list = []
-        for torrent in my_channel.torrents:
+        for index in my_channel.torrents:
+            torrent = all_torrents[index]
             torrent_list.append({'name': torrent.name, 'infohash': torrent.infohash, 'added': torrent.time_added})
 
         return json.dumps({"torrents": torrent_list})
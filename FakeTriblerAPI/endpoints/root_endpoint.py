@@ -16,6 +16,7 @@ from FakeTriblerAPI.endpoints.torrents_endpoint import TorrentsEndpoint
 from FakeTriblerAPI.endpoints.trustchain_endpoint import TrustchainEndpoint
 from FakeTriblerAPI.endpoints.settings_endpoint import SettingsEndpoint
 from FakeTriblerAPI.endpoints.wallets_endpoint import WalletsEndpoint
+from FakeTriblerAPI.resource_monitor import ResourceMonitor
 
 
 class RootEndpoint(resource.Resource):
@@ -29,13 +30,17 @@ class RootEndpoint(resource.Resource):
         self.search_endpoint = SearchEndpoint(self.events_endpoint)
         self.putChild("search", self.search_endpoint)
 
+        self.resource_monitor = ResourceMonitor()
+        self.debug_endpoint = DebugEndpoint(self.events_endpoint, self.resource_monitor)
+        self.putChild("debug", self.debug_endpoint)
+
         child_handler_dict = {"channels": ChannelsEndpoint, "mychannel": MyChannelEndpoint,
                               "settings": SettingsEndpoint,
                               "downloads": DownloadsEndpoint, "torrents": TorrentsEndpoint,
                               "trustchain": TrustchainEndpoint, "statistics": StatisticsEndpoint,
                               "state": StateEndpoint, "torrentinfo": TorrentInfoEndpoint,
                               "wallets": WalletsEndpoint, "market": MarketEndpoint, "shutdown": ShutdownEndpoint,
-                              "debug": DebugEndpoint, "ipv8": IPv8Endpoint}
+                              "ipv8": IPv8Endpoint}
 
         for path, child_cls in child_handler_dict.iteritems():
             self.putChild(path, child_cls())
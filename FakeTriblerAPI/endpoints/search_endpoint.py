@@ -1,10 +1,40 @@
 import json
-from random import randint, sample
+import re
 
 from twisted.web import http, resource
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
 
+# The default maximum number of torrents and channels returned for a query
+MAX_TORRENT_RESULTS = 100
+MAX_CHANNEL_RESULTS = 20
+
+# The default number of completions and suggestions returned for a query
+MAX_COMPLETIONS = 5
+MAX_SUGGESTIONS = 3
+
+# The (possibly empty) token that is being typed at the end of a query
+LAST_TOKEN_PATTERN = re.compile(r"[a-z0-9]*$")
+
+
+def get_torrent_filter():
+    """
+    Returns a function that accepts the indices of the torrents that pass the family filter, or None if it is disabled.
+    """
+    if not tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"]:
+        return None
+    torrents = tribler_utils.tribler_data.torrents
+    return lambda index: torrents[index].category != 'xxx'
+
+
+def get_completions(query, limit):
+    """
+    Returns at most limit queries that complete the last token of the given query, most frequent token first.
+    """
+    prefix = LAST_TOKEN_PATTERN.search(query.lower()).group()
+    head = query[:len(query) - len(prefix)]
+    return [head + token for token in tribler_utils.tribler_data.completion_index.complete(prefix, limit)]
+
 
 class SearchEndpoint(resource.Resource):
 
@@ -15,26 +45,38 @@ class SearchEndpoint(resource.Resource):
         self.putChild("suggestions", SearchSuggestionsEndpoint())
         self.putChild("completions", SearchCompletionsEndpoint())
 
+    @staticmethod
+    def get_max_results(request, default, parameter='max_results'):
+        if parameter not in request.args:
+            return default
+        return max(int(request.args[parameter][0]), 0)
+
     def render_GET(self, request):
-        # Just ignore the query and return some random channels/torrents
-        num_channels = len(tribler_utils.tribler_data.channels)
-        num_torrents = len(tribler_utils.tribler_data.torrents)
+        if 'q' not in request.args:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "q parameter missing"})
+
+        try:
+            max_torrents = SearchEndpoint.get_max_results(request, MAX_TORRENT_RESULTS, parameter='max_torrents')
+            max_channels = SearchEndpoint.get_max_results(request, MAX_CHANNEL_RESULTS, parameter='max_channels')
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "max_torrents and max_channels should be numbers"})
 
-        picked_torrents = sample(range(0, num_torrents - 1), randint(20, num_channels - 1))
-        picked_channels = sample(range(0, num_channels - 1), randint(5, min(20, num_channels - 1)))
+        query = request.args['q'][0]
+        torrents = tribler_utils.tribler_data.torrents
+        channels = tribler_utils.tribler_data.channels
 
         torrents_json = []
-        for index in picked_torrents:
-            torrent_json = tribler_utils.tribler_data.torrents[index].get_json()
-            if tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"] and torrent_json["category"] == 'xxx':
-                continue
-            torrents_json.append(torrent_json)
+        for index, score in tribler_utils.tribler_data.torrent_search_index.search(query, max_torrents,
+                                                                                   accept=get_torrent_filter()):
+            torrents_json.append(torrents[index].get_json_fragment(relevance_score=score))
 
         self.events_endpoint.on_search_results_torrents(torrents_json)
 
         channels_json = []
-        for index in picked_channels:
-            channels_json.append(tribler_utils.tribler_data.channels[index].get_json())
+        for index, score in tribler_utils.tribler_data.channel_search_index.search(query, max_channels):
+            channels_json.append(channels[index].get_json_fragment(relevance_score=score))
 
         self.events_endpoint.on_search_results_channels(channels_json)
 
@@ -42,20 +84,45 @@ class SearchEndpoint(resource.Resource):
 
 
 class SearchSuggestionsEndpoint(resource.Resource):
+    """
+    Suggests the names of the best matching torrents for the most frequent completion of a query.
+    """
 
     def render_GET(self, request):
         if 'q' not in request.args:
             request.setResponseCode(http.BAD_REQUEST)
-            return json.dumps({"error": "kw parameter missing"})
+            return json.dumps({"error": "q parameter missing"})
+
+        try:
+            max_suggestions = SearchEndpoint.get_max_results(request, MAX_SUGGESTIONS)
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "max_results should be a number"})
+
+        query = request.args['q'][0]
+        completions = get_completions(query, 1)
+        if completions:
+            query = completions[0]
 
-        return json.dumps({"suggestions": ["tribler1", "tribler2", "tribler3"]})
+        suggestions = tribler_utils.tribler_data.torrent_search_index.search_texts(query, max_suggestions,
+                                                                                   accept=get_torrent_filter())
+        return json.dumps({"suggestions": [name for name, _ in suggestions]})
 
 
 class SearchCompletionsEndpoint(resource.Resource):
+    """
+    Completes the last token of a query with the most frequent tokens in the torrent names.
+    """
 
     def render_GET(self, request):
         if 'q' not in request.args:
             request.setResponseCode(http.BAD_REQUEST)
-            return json.dumps({"error": "kw parameter missing"})
+            return json.dumps({"error": "q parameter missing"})
+
+        try:
+            max_completions = SearchEndpoint.get_max_results(request, MAX_COMPLETIONS)
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "max_results should be a number"})
 
-        return json.dumps({"completions": ["tribler1", "tribler2", "tribler3", "tribler4", "tribler5"]})
+        return json.dumps({"completions": get_completions(request.args['q'][0], max_completions)})
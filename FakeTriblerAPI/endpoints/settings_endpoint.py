@@ -1,5 +1,5 @@
 import json
-from twisted.web import resource
+from twisted.web import http, resource
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
 
@@ -10,6 +10,8 @@ class SettingsEndpoint(resource.Resource):
 
     # Only contains the most necessary settings needed for the GUI
     def render_GET(self, request):
+        if request.setETag(tribler_utils.tribler_data.get_etag("settings")) == http.CACHED:
+            return ""
         return json.dumps(tribler_utils.tribler_data.settings)
 
     # Do nothing when we are saving the settings
@@ -1,9 +1,9 @@
-import json
 from random import sample
 
 from twisted.web import resource
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
+from FakeTriblerAPI.utils import encode_json_list
 
 
 class TorrentsEndpoint(resource.Resource):
@@ -17,11 +17,11 @@ class TorrentsRandomEndpoint(resource.Resource):
 
     def render_GET(self, request):
         rand_torrents = sample(tribler_utils.tribler_data.torrents, 20)
+        family_filter = tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"]
         response_torrents = []
         for torrent in rand_torrents:
-            torrent_json = torrent.get_json()
-            if tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"] and torrent_json["category"] == 'xxx':
+            if family_filter and torrent.category == 'xxx':
                 continue
 
-            response_torrents.append(torrent_json)
-        return json.dumps({"torrents": response_torrents})
+            response_torrents.append(torrent.get_json_fragment())
+        return encode_json_list("torrents", response_torrents)
@@ -1,22 +1,178 @@
+"""
+This module contains the video server, which streams a virtual video file for every infohash.
+
+A video file is as large as the torrent with its infohash, which can be several gigabytes, but it is not backed by a
+file of that size. Its content repeats the chunks of a small template video. The chunks are split once, so serving
+a chunk-aligned part of a video writes an existing string rather than reading or slicing a new one. Range requests
+are answered with 206 responses like a real video server, so seeking in the player works.
+"""
 import os
+import re
 
-from twisted.web import resource
-from twisted.web.static import File
+from twisted.internet.interfaces import IPullProducer
+from twisted.web import http, resource, server
+from zope.interface import implementer
 
 import FakeTriblerAPI
+import FakeTriblerAPI.tribler_utils as tribler_utils
+
+VIDEO_TEMPLATE_PATH = os.path.join(os.path.dirname(FakeTriblerAPI.__file__), "data", "video.avi")
+VIDEO_CONTENT_TYPE = "video/x-msvideo"
+
+# The number of bytes that is written at once, the template is split into chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+# The size of the video of an infohash that is not known
+DEFAULT_VIDEO_SIZE = 1024 * 1024 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Returns the first and last byte position (inclusive) requested by the given Range header for a file of the given
+    size, or None if the whole file should be served. Multiple ranges are not supported, so these are answered with the
+    whole file as well. Raises a ValueError if the requested range is not satisfiable.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix range requests the last bytes of the file
+        last = int(last)
+        if last == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - last, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        raise ValueError("range not satisfiable")
+    return first, last
+
+
+class VideoTemplate(object):
+    """
+    The content of the virtual video files, split into chunks. Only whole chunks are used, so a video file repeats
+    the template from its beginning every len(chunks) * chunk_size bytes.
+    """
+
+    def __init__(self, path=VIDEO_TEMPLATE_PATH, chunk_size=CHUNK_SIZE):
+        with open(path, 'rb') as template_file:
+            data = template_file.read()
+        num_chunks = max(len(data) // chunk_size, 1)
+        self.chunks = [data[index * chunk_size:(index + 1) * chunk_size] for index in xrange(num_chunks)]
+        self.chunk_size = len(self.chunks[0])
+
+    def get_data(self, position, max_length):
+        """
+        Returns the data at the given position of a video file, up to the end of its chunk and at most max_length bytes.
+        """
+        index, offset = divmod(position, self.chunk_size)
+        chunk = self.chunks[index % len(self.chunks)]
+        if offset == 0 and max_length >= len(chunk):
+            return chunk
+        return chunk[offset:offset + max_length]
+
+
+@implementer(IPullProducer)
+class VideoProducer(object):
+    """
+    Writes the bytes from first up to and including last of a video file to a request, one chunk whenever the
+    transport asks for more.
+    """
+
+    def __init__(self, request, template, first, last):
+        self.request = request
+        self.template = template
+        self.position = first
+        self.last = last
+
+    def start(self):
+        self.request.registerProducer(self, False)
+
+    def resumeProducing(self):
+        if not self.request:
+            return
+        data = self.template.get_data(self.position, self.last + 1 - self.position)
+        self.position += len(data)
+        # Guard against a stopProducing that happens during the write, the request must not be finished then
+        self.request.write(data)
+        if self.request and self.position > self.last:
+            self.request.unregisterProducer()
+            self.request.finish()
+            self.stopProducing()
+
+    def stopProducing(self):
+        self.request = None
 
 
 class VideoRootEndpoint(resource.Resource):
 
+    def __init__(self, template=None):
+        resource.Resource.__init__(self)
+        self.template = template or VideoTemplate()
+
     def getChild(self, path, request):
-        return VideoEndpoint(path)
+        return VideoEndpoint(path, self.template)
 
 
 class VideoEndpoint(resource.Resource):
 
-    def __init__(self, infohash):
+    def __init__(self, infohash, template):
         resource.Resource.__init__(self)
         self.infohash = infohash
+        self.template = template
+
+    def get_video_size(self):
+        """
+        Returns the size of the video file, which is the size of the torrent with the infohash of this video.
+        """
+        download = tribler_utils.tribler_data.get_download_with_infohash(self.infohash)
+        if download is not None:
+            return download.torrent.length
+        torrent_index = tribler_utils.tribler_data.get_torrent_index(self.infohash)
+        if torrent_index is not None:
+            return tribler_utils.tribler_data.torrents[torrent_index].length
+        return DEFAULT_VIDEO_SIZE
 
     def getChild(self, path, request):
-        return File(os.path.join(os.path.dirname(FakeTriblerAPI.__file__), "data", "video.avi"))
+        return VideoFileEndpoint(self.template, self.get_video_size())
+
+
+class VideoFileEndpoint(resource.Resource):
+
+    isLeaf = True
+
+    def __init__(self, template, size):
+        resource.Resource.__init__(self)
+        self.template = template
+        self.size = size
+
+    def render_GET(self, request):
+        request.setHeader('Accept-Ranges', 'bytes')
+        request.setHeader('Content-Type', VIDEO_CONTENT_TYPE)
+
+        try:
+            requested_range = parse_range(request.getHeader('range'), self.size)
+        except ValueError:
+            request.setResponseCode(http.REQUESTED_RANGE_NOT_SATISFIABLE)
+            request.setHeader('Content-Range', 'bytes */%d' % self.size)
+            return ""
+
+        if requested_range is None:
+            first, last = 0, self.size - 1
+        else:
+            first, last = requested_range
+            request.setResponseCode(http.PARTIAL_CONTENT)
+            request.setHeader('Content-Range', 'bytes %d-%d/%d' % (first, last, self.size))
+        request.setHeader('Content-Length', str(last + 1 - first))
+
+        if request.method == 'HEAD' or last < first:
+            return ""
+
+        VideoProducer(request, self.template, first, last).start()
+        return server.NOT_DONE_YET
@@ -0,0 +1,100 @@
+"""
+This module contains a producer that writes large JSON lists to a request in chunks.
+
+Encoding a list of a hundred thousand items with a single json.dumps call blocks the reactor until it is done, so the
+events stream and all other clients stall in the meantime, and the whole response is held in memory. The producer
+encodes a chunk of items per reactor iteration instead, and stops while the connection of the client is congested.
+Other requests are served in between chunks and the memory used by a response stays bounded by the transport buffer
+and a single chunk.
+"""
+from itertools import islice
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.web import server
+from zope.interface import implementer
+
+from FakeTriblerAPI.utils import encode_json_fields, encode_json_list
+
+# The number of items that is encoded per reactor iteration
+CHUNK_SIZE = 500
+
+# Lists with fewer items are encoded at once, since streaming them only adds overhead
+STREAMING_THRESHOLD = 2000
+
+
+@implementer(IPushProducer)
+class JSONListProducer(object):
+    """
+    Writes a JSON dictionary that maps the given key to the fragments of the given items, together with the given
+    additional fields, in the same format as encode_json_list. The fragment of an item is returned by get_fragment.
+    """
+
+    def __init__(self, request, key, items, get_fragment, chunk_size=CHUNK_SIZE, **fields):
+        self.request = request
+        self.key = key
+        self.items = iter(items)
+        self.get_fragment = get_fragment
+        self.chunk_size = chunk_size
+        self.fields = fields
+        self.separator = ""
+        self.produce_call = None
+        self.paused = False
+        self.finished = False
+
+    def start(self):
+        self.request.registerProducer(self, True)
+        self.request.notifyFinish().addErrback(lambda _: self.stopProducing())
+        self.request.write('{"%s": [' % self.key)
+        self.schedule()
+
+    def schedule(self):
+        if self.produce_call is None and not self.paused and not self.finished:
+            self.produce_call = reactor.callLater(0, self.produce)
+
+    def produce(self):
+        """
+        Writes the next chunk of items, or the end of the response when all items have been written.
+        """
+        self.produce_call = None
+        if self.paused or self.finished:
+            return
+
+        fragments = [self.get_fragment(item) for item in islice(self.items, self.chunk_size)]
+        if fragments:
+            self.request.write(self.separator + ", ".join(fragments))
+            self.separator = ", "
+
+        if len(fragments) < self.chunk_size:
+            self.request.write(']%s}' % encode_json_fields(**self.fields))
+            self.finished = True
+            self.request.unregisterProducer()
+            self.request.finish()
+        else:
+            self.schedule()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.schedule()
+
+    def stopProducing(self):
+        self.finished = True
+        if self.produce_call is not None and self.produce_call.active():
+            self.produce_call.cancel()
+        self.produce_call = None
+
+
+def render_json_list(request, key, items, num_items, get_fragment, **fields):
+    """
+    Returns the same JSON encoding as encode_json_list for the fragments of the given items. Lists of at least
+    STREAMING_THRESHOLD items are streamed to the request by a JSONListProducer instead, in which case NOT_DONE_YET is
+    returned.
+    """
+    if num_items < STREAMING_THRESHOLD:
+        return encode_json_list(key, [get_fragment(item) for item in items], **fields)
+
+    JSONListProducer(request, key, items, get_fragment, **fields).start()
+    return server.NOT_DONE_YET
@@ -0,0 +1,170 @@
+"""
+This module contains a site that measures the requests to every route of the resource tree.
+
+A route is the template of the paths that end up at the same kind of resource, for instance
+/channels/discovered/{cid}/torrents. Path segments that match a child added with putChild are kept, the segments that
+are handled by getChild are replaced by a parameter. For every route, the site counts the requests and response bytes
+and keeps a histogram of the time between receiving a request and finishing its response. For streamed responses,
+like the events stream, this is the time the stream has been open.
+"""
+import copy
+import time
+from bisect import bisect_left
+
+from twisted.web import resource, server
+
+# The upper bounds, in milliseconds, of the buckets of the latency histograms. The last bucket holds everything slower.
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# The name of the parameter that replaces the dynamic children of the given routes, None keeps the path segment. The
+# dynamic children of other routes are replaced by {id}.
+ROUTE_PARAMETERS = {
+    "/channels/subscribed": "cid",
+    "/channels/discovered": "cid",
+    "/channels/discovered/{cid}/playlists": "playlist_id",
+    "/channels/discovered/{cid}/playlists/{playlist_id}": "infohash",
+    "/channels/discovered/{cid}/rssfeeds": "feed_url",
+    "/downloads": "infohash",
+    "/ipv8/trustchain/users": "public_key",
+    "/market/transactions": "trader_id",
+    "/market/transactions/{trader_id}": "transaction_number",
+    "/mychannel": None,
+}
+DEFAULT_ROUTE_PARAMETER = "id"
+
+# Requests for paths that do not exist are counted under this route
+NOT_FOUND_ROUTE = "(not found)"
+
+PERCENTILES = (50, 95, 99)
+
+
+class RouteMetrics(object):
+    """
+    The number of requests, response bytes and the latency histogram of a single route.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, duration, num_bytes):
+        milliseconds = 1000 * duration
+        self.requests += 1
+        self.bytes += num_bytes
+        self.total_time += milliseconds
+        self.max_time = max(self.max_time, milliseconds)
+        self.histogram[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+
+    def get_percentile(self, percentile):
+        """
+        Returns the upper bound of the bucket that contains the given percentile, or the maximum latency for the last
+        bucket.
+        """
+        rank = percentile / 100.0 * self.requests
+        count = 0
+        for index, bucket_count in enumerate(self.histogram[:-1]):
+            count += bucket_count
+            if count >= rank:
+                return min(LATENCY_BUCKETS[index], self.max_time)
+        return self.max_time
+
+    def to_dictionary(self):
+        metrics = {
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "mean_ms": self.total_time / self.requests if self.requests else None,
+            "max_ms": self.max_time,
+            "histogram": [{"le_ms": bound, "count": count}
+                          for bound, count in zip(LATENCY_BUCKETS + (None,), self.histogram)],
+        }
+        for percentile in PERCENTILES:
+            metrics["p%d_ms" % percentile] = self.get_percentile(percentile) if self.requests else None
+        return metrics
+
+
+class Metrics(object):
+    """
+    The metrics of all routes since the last reset.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.start_time = time.time()
+
+    def record(self, route, duration, num_bytes):
+        route_metrics = self.routes.get(route)
+        if route_metrics is None:
+            route_metrics = self.routes[route] = RouteMetrics()
+        route_metrics.record(duration, num_bytes)
+
+    def reset(self):
+        self.routes = {}
+        self.start_time = time.time()
+
+    def to_dictionary(self):
+        return {"since": self.start_time,
+                "routes": dict((route, route_metrics.to_dictionary())
+                               for route, route_metrics in self.routes.iteritems())}
+
+
+class MetricsRequest(server.Request):
+    """
+    A request that reports its route, duration and number of response bytes to the metrics of its site when it is
+    finished or its connection is lost.
+    """
+
+    def __init__(self, *args, **kwargs):
+        server.Request.__init__(self, *args, **kwargs)
+        self.route = None
+        self.start_time = None
+        self.sent_bytes = 0
+
+    def process(self):
+        self.start_time = time.time()
+        self.notifyFinish().addBoth(self.on_finished)
+        server.Request.process(self)
+
+    def write(self, data):
+        self.sent_bytes += len(data)
+        server.Request.write(self, data)
+
+    def on_finished(self, _):
+        if self.route is not None:
+            self.site.metrics.record(self.route, time.time() - self.start_time, self.sent_bytes)
+
+
+class MetricsSite(server.Site):
+    """
+    A site that keeps metrics per route.
+    """
+
+    requestFactory = MetricsRequest
+
+    def __init__(self, root_resource, *args, **kwargs):
+        server.Site.__init__(self, root_resource, *args, **kwargs)
+        self.metrics = Metrics()
+
+    def getResourceFor(self, request):
+        """
+        Looks up the resource for the given request like Site does, and sets the route of the request on the way.
+        """
+        request.site = self
+        request.sitepath = copy.copy(request.prepath)
+
+        current = self.resource
+        route = ""
+        while request.postpath and not current.isLeaf:
+            path_element = request.postpath.pop(0)
+            request.prepath.append(path_element)
+            if path_element in current.children:
+                route += "/" + path_element
+            else:
+                parameter = ROUTE_PARAMETERS.get(route, DEFAULT_ROUTE_PARAMETER)
+                route += "/" + (path_element if parameter is None else "{%s}" % parameter)
+            current = current.getChildWithDefault(path_element, request)
+
+        request.route = NOT_FOUND_ROUTE if isinstance(current, resource.ErrorPage) else (route or "/")
+        return current
@@ -1,13 +1,21 @@
-from random import randint, uniform, sample
+from array import array
+from bisect import bisect_left
+import json
+from random import randint, random, uniform
 
 import FakeTriblerAPI.tribler_utils as tribler_utils
 from FakeTriblerAPI.models.playlist import Playlist
 from FakeTriblerAPI.utils import get_random_hex_string
 
 
-class Channel:
+class Channel(object):
+
+    # Changing any of these attributes invalidates the cached JSON fragment
+    JSON_ATTRIBUTES = frozenset(['id', 'name', 'description', 'votes', 'torrents', 'spam_votes', 'modified',
+                                 'subscribed', 'cid'])
 
     def __init__(self, id, name="", description=""):
+        self._json_prefix = None
         self.name = name
         self.description = description
         self.id = id
@@ -15,7 +23,8 @@ class Channel:
         self.votes = randint(0, 10000)
         self.spam_votes = randint(0, 10000)
         self.modified = randint(10, 10000)
-        self.torrents = set()
+        # Sorted indices of the torrents in this channel into the torrents of the Tribler data
+        self.torrents = array('I')
         self.subscribed = False
         self.playlists = set()
         self.relevance_score = uniform(0, 5)
@@ -25,24 +34,30 @@ class Channel:
 
     def add_random_torrents(self):
         all_torrents = tribler_utils.tribler_data.torrents
-        num_torrents_in_channel = randint(1, len(all_torrents) - 1)
-        for i in range(0, num_torrents_in_channel):
-            self.torrents.add(tribler_utils.tribler_data.torrents[randint(0, len(all_torrents) - 1)])
+        max_torrents = tribler_utils.tribler_data.profile["channel_torrents"] or len(all_torrents) - 1
+        num_torrents_in_channel = randint(1, min(max_torrents, len(all_torrents) - 1))
+        # Draw with replacement and drop the duplicates, which is much cheaper than sampling without replacement
+        num_all_torrents = len(all_torrents)
+        self.torrents = array('I', sorted(set([int(random() * num_all_torrents)
+                                               for _ in xrange(num_torrents_in_channel)])))
 
     def create_playlist(self, name, description, add_random_torrents=False):
-        playlist = Playlist(len(self.playlists) + 1, name, description)
-
+        torrents = None
         if add_random_torrents:
-            picked_torrents = sample(self.torrents, randint(1, min(20, len(self.torrents))))
-            for torrent in picked_torrents:
-                playlist.add_torrent(torrent)
+            # The torrents of a channel are a random sample of all torrents, so a random slice of them is one as well.
+            # Random numbers are drawn with random() rather than randint, which is several times slower.
+            num_torrents = len(self.torrents)
+            num_playlist_torrents = 1 + int(random() * min(20, num_torrents))
+            start = int(random() * (num_torrents - num_playlist_torrents + 1))
+            torrents = set(map(tribler_utils.tribler_data.torrents.__getitem__,
+                               self.torrents[start:start + num_playlist_torrents]))
 
-        self.playlists.add(playlist)
+        self.playlists.add(Playlist(len(self.playlists) + 1, name, description, torrents=torrents))
 
     def generate_playlist(self):
-        num_playlists = randint(1, 5)
-        for i in range(num_playlists):
-            self.create_playlist("Test playlist %d" % randint(1, 40), "This is a description", add_random_torrents=True)
+        for _ in xrange(1 + int(random() * 5)):
+            self.create_playlist("Test playlist %d" % (1 + int(random() * 40)), "This is a description",
+                                 add_random_torrents=True)
 
     def get_json(self):
         return {"id": self.id, "name": self.name, "description": self.description, "votes": self.votes,
@@ -50,6 +65,24 @@ class Channel:
                 "subscribed": self.subscribed, "dispersy_cid": self.cid, "relevance_score": self.relevance_score,
                 "can_edit": self.subscribed}
 
+    def __setattr__(self, name, value):
+        if name in Channel.JSON_ATTRIBUTES:
+            self.__dict__['_json_prefix'] = None
+        object.__setattr__(self, name, value)
+
+    def get_json_fragment(self, relevance_score=None):
+        """
+        Returns the JSON encoding of get_json, optionally with the given relevance score. Everything but the relevance
+        score is encoded once and cached until one of the encoded attributes changes, the score is spliced in.
+        """
+        if self._json_prefix is None:
+            channel_json = self.get_json()
+            del channel_json["relevance_score"]
+            self._json_prefix = json.dumps(channel_json)[:-1] + ', "relevance_score": '
+        if relevance_score is None:
+            relevance_score = self.relevance_score
+        return self._json_prefix + repr(relevance_score) + '}'
+
     def get_playlist_with_id(self, pid):
         for playlist in self.playlists:
             if playlist.id == int(pid):
@@ -58,7 +91,11 @@ class Channel:
         return None
 
     def get_torrent_with_infohash(self, infohash):
-        for torrent in self.torrents:
-            if torrent.infohash == infohash:
-                return torrent
+        index = tribler_utils.tribler_data.get_torrent_index(infohash)
+        if index is None:
+            return None
+
+        position = bisect_left(self.torrents, index)
+        if position < len(self.torrents) and self.torrents[position] == index:
+            return tribler_utils.tribler_data.torrents[index]
         return None
@@ -1,15 +1,72 @@
 import base64
-from random import randint, uniform, random
+from collections import OrderedDict
+from operator import attrgetter
+from random import getrandbits, randint, uniform, random
 
 from FakeTriblerAPI.constants import DLSTATUS_STRINGS
 from FakeTriblerAPI.models.download_peer import DownloadPeer
 
+# The fields of the JSON representation of a download, with a function that returns the value of each field
+JSON_FIELDS = OrderedDict([
+    ("name", attrgetter("torrent.name")),
+    ("infohash", attrgetter("torrent.infohash")),
+    ("status", lambda download: DLSTATUS_STRINGS[download.status]),
+    ("num_peers", attrgetter("num_peers")),
+    ("num_seeds", attrgetter("seeds")),
+    ("progress", attrgetter("progress")),
+    ("size", attrgetter("torrent.length")),
+    ("speed_down", attrgetter("down_speed")),
+    ("speed_up", attrgetter("up_speed")),
+    ("eta", lambda download: 1234),
+    ("hops", attrgetter("anon_hops")),
+    ("anon_download", attrgetter("anon")),
+    ("files", attrgetter("files")),
+    ("trackers", attrgetter("trackers")),
+    ("destination", attrgetter("destination")),
+    ("availability", attrgetter("availability")),
+    ("total_pieces", attrgetter("total_pieces")),
+    ("total_up", attrgetter("total_up")),
+    ("total_down", attrgetter("total_down")),
+    ("ratio", attrgetter("ratio")),
+    ("error", lambda download: "unknown"),
+    ("time_added", attrgetter("time_added")),
+    ("vod_mode", lambda download: False),
+    ("vod_prebuffering_progress_consec", lambda download: 0.34),
+    ("credit_mining", lambda download: False),
+    ("num_connected_peers", attrgetter("num_connected_peers")),
+    ("num_connected_seeds", attrgetter("num_connected_seeds")),
+])
 
-class Download:
+# The maximum number of projections that are kept, the least recently used ones are dropped first
+PROJECTIONS_CACHE_SIZE = 64
 
-    def __init__(self, torrent):
+
+def build_projection(fields):
+    getters = tuple((field, JSON_FIELDS[field]) for field in fields)
+    return lambda download: {field: getter(download) for field, getter in getters}
+
+
+FULL_PROJECTION = build_projection(tuple(JSON_FIELDS))
+
+
+class Download(object):
+
+    __slots__ = ('torrent', 'simulation', 'row', 'anon', 'anon_hops', 'safe_seeding', 'num_peers', 'seeds',
+                 'num_connected_peers', 'num_connected_seeds', 'files', 'trackers', 'destination', 'availability',
+                 'peers', 'total_pieces', 'time_added', 'has_pieces', '_num_pieces', '_pieces_base64')
+
+    # The functions returned by get_projection, by their sorted fields
+    projections = OrderedDict()
+
+    # The attributes that change over time, these are stored in a row of the download simulation
+    SIMULATED_ATTRIBUTES = ('status', 'progress', 'down_speed', 'up_speed', 'total_up', 'total_down')
+
+    def __init__(self, torrent, simulation):
         self.torrent = torrent
-        self.status = randint(0, 8)
+        self.simulation = simulation
+        self.row = simulation.add_row(self, status=randint(0, 8), progress=uniform(0, 1),
+                                      down_speed=randint(0, 1000000), up_speed=randint(0, 1000000),
+                                      total_down=randint(0, 1000000), total_up=randint(0, 1000000))
         self.anon = True if randint(0, 1) == 0 else False
         self.anon_hops = randint(1, 3) if self.anon else 0
         self.safe_seeding = True if randint(0, 1) == 0 else False
@@ -17,24 +74,21 @@ class Download:
         self.seeds = randint(0, 1000)
         self.num_connected_peers = randint(0, 100)
         self.num_connected_seeds = randint(0, 100)
-        self.progress = uniform(0, 1)
-        self.down_speed = randint(0, 1000000)
-        self.up_speed = randint(0, 1000000)
-        self.total_up = randint(0, 1000000)
-        self.total_down = randint(0, 1000000)
-        self.ratio = float(self.total_up) / float(self.total_down)
         self.files = []
         self.trackers = [{"url": "[PEX]", "status": "working", "peers": 42}]
         self.destination = "/"
         self.availability = uniform(0, 5)
         self.peers = []
         self.total_pieces = randint(100, 2000)
-        self.has_pieces = [False] * self.total_pieces
         self.time_added = randint(1400000000, 1484819242)
 
-        # Set some pieces to True
-        for _ in xrange(self.total_pieces / 2):
-            self.has_pieces[randint(0, self.total_pieces - 1)] = True
+        # The pieces are a packed bitfield, the first piece is the most significant bit of the first byte and the
+        # last byte is padded with zeros. Every piece is available with a chance of 50%.
+        num_bytes = (self.total_pieces + 7) / 8
+        random_bits = getrandbits(self.total_pieces) << (num_bytes * 8 - self.total_pieces)
+        self.has_pieces = bytearray(('%0*x' % (num_bytes * 2, random_bits)).decode('hex'))
+        self._num_pieces = None
+        self._pieces_base64 = None
 
         for _ in xrange(randint(5, 40)):
             self.peers.append(DownloadPeer())
@@ -44,26 +98,91 @@ class Download:
             self.files.append({"name": "File %d" % file_ind, "size": randint(1000, 10000000),
                                "progress": random(), "included": True if random() > 0.5 else False})
 
+    status = property(lambda self: self.simulation.status[self.row],
+                      lambda self, status: self.simulation.set_status(self.row, status))
+    # A finished download can be ahead of its progress until the next tick marks it as seeding
+    progress = property(lambda self: min(self.simulation.progress[self.row], 1.0))
+    down_speed = property(lambda self: self.simulation.down_speed[self.row])
+    up_speed = property(lambda self: self.simulation.up_speed[self.row])
+    total_down = property(lambda self: self.simulation.total_down[self.row])
+    total_up = property(lambda self: self.simulation.total_up[self.row])
+
+    @property
+    def ratio(self):
+        return self.total_up / self.total_down if self.total_down else 0.0
+
+    def sync_pieces(self):
+        """
+        Completes pieces until the number of available pieces matches the progress. The simulation only advances the
+        progress, so pieces are completed when they are read.
+        """
+        if self._num_pieces is None:
+            self._num_pieces = sum(bin(byte).count('1') for byte in self.has_pieces)
+
+        missing = int(self.progress * self.total_pieces) - self._num_pieces
+        index = 0
+        while missing > 0 and index < len(self.has_pieces):
+            byte = self.has_pieces[index]
+            if byte != 0xFF:
+                for bit in xrange(8):
+                    if missing > 0 and not byte & (0x80 >> bit) and (index << 3) + bit < self.total_pieces:
+                        byte |= 0x80 >> bit
+                        missing -= 1
+                        self._num_pieces += 1
+                self.has_pieces[index] = byte
+                self._pieces_base64 = None
+            index += 1
+
+    def set_selected_files(self, selected_files):
+        """
+        Includes only the files with the given names in this download.
+        """
+        selected_files = set(selected_files)
+        for download_file in self.files:
+            download_file["included"] = download_file["name"] in selected_files
+        self.simulation.touch(self.row)
+
+    def has_piece(self, index):
+        self.sync_pieces()
+        return bool(self.has_pieces[index >> 3] & (0x80 >> (index & 7)))
+
     def get_pieces_base64(self):
-        bitstr = ""
-        for bit in self.has_pieces:
-            bitstr += '1' if bit else '0'
-
-        encoded_str = ""
-        for i in range(0, len(bitstr), 8):
-            encoded_str += chr(int(bitstr[i:i+8].ljust(8, '0'), 2))
-        return base64.b64encode(encoded_str)
-
-    def get_json(self, get_peers=False, get_pieces=False):
-        download = {"name": self.torrent.name, "infohash": self.torrent.infohash, "status": DLSTATUS_STRINGS[self.status],
-                    "num_peers": self.num_peers, "num_seeds": self.seeds, "progress": self.progress,
-                    "size": self.torrent.length, "speed_down": self.down_speed, "speed_up": self.up_speed, "eta": 1234,
-                    "hops": self.anon_hops, "anon_download": self.anon, "files": self.files, "trackers": self.trackers,
-                    "destination": self.destination, "availability": self.availability,
-                    "total_pieces": self.total_pieces, "total_up": self.total_up, "total_down": self.total_down,
-                    "ratio": self.ratio, "error": "unknown", "time_added": self.time_added, "vod_mode": False,
-                    "vod_prebuffering_progress_consec": 0.34, "credit_mining": False,
-                    "num_connected_peers": self.num_connected_peers, "num_connected_seeds": self.num_connected_seeds}
+        """
+        Returns the base64 encoded bitfield of the pieces, which is cached until a piece changes.
+        """
+        self.sync_pieces()
+        if self._pieces_base64 is None:
+            self._pieces_base64 = base64.b64encode(bytes(self.has_pieces))
+        return self._pieces_base64
+
+    @staticmethod
+    def get_projection(fields=None):
+        """
+        Returns a function that returns the JSON representation of a download with only the given fields, or with all
+        fields if none are given. The functions of recently used sets of fields are cached. Raises a ValueError if one
+        of the fields is unknown.
+        """
+        if fields is None:
+            return FULL_PROJECTION
+
+        fields = tuple(sorted(set(fields)))
+        projection = Download.projections.pop(fields, None)
+        if projection is None:
+            unknown = [field for field in fields if field not in JSON_FIELDS]
+            if unknown:
+                raise ValueError("unknown fields %s" % ", ".join(unknown))
+
+            projection = build_projection(fields)
+            if len(Download.projections) >= PROJECTIONS_CACHE_SIZE:
+                Download.projections.popitem(last=False)
+        Download.projections[fields] = projection
+        return projection
+    def get_json(self, get_peers=False, get_pieces=False, projection=None):
+        """
+        Returns the JSON representation of this download. The fields are determined by the given function from
+        get_projection, by default all fields are included.
+        """
+        download = (projection or Download.get_projection())(self)
 
         if get_peers:
             download["peers"] = [peer.get_info_dict() for peer in self.peers]
@@ -1,18 +1,23 @@
-from random import randint, uniform
+from random import random
 
+from FakeTriblerAPI.utils import get_random_int
 
-class DownloadPeer:
+
+class DownloadPeer(object):
+
+    __slots__ = ('ip', 'port', 'id', 'client', 'connection_type', 'direction', 'completed', 'downrate', 'uprate')
 
     def __init__(self):
-        self.ip = "%d.%d.%d.%d" % (randint(0, 255), randint(0, 255), randint(0, 255), randint(0, 255))
-        self.port = randint(1000, 65536)
+        self.ip = "%d.%d.%d.%d" % (get_random_int(0, 255), get_random_int(0, 255), get_random_int(0, 255),
+                                   get_random_int(0, 255))
+        self.port = get_random_int(1000, 65536)
         self.id = "abcd"
         self.client = "Tribler x.x"
-        self.connection_type = randint(0, 3)
-        self.direction = "L" if randint(0, 1) == 0 else "R"
-        self.completed = uniform(0, 1)
-        self.downrate = randint(0, 10000)
-        self.uprate = randint(0, 10000)
+        self.connection_type = get_random_int(0, 3)
+        self.direction = "L" if random() < 0.5 else "R"
+        self.completed = random()
+        self.downrate = get_random_int(0, 10000)
+        self.uprate = get_random_int(0, 10000)
 
     def get_info_dict(self):
         return {
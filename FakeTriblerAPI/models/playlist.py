@@ -1,13 +1,15 @@
+import json
+
 import FakeTriblerAPI.tribler_utils as tribler_utils
 
 
 class Playlist:
 
-    def __init__(self, id, name, description):
+    def __init__(self, id, name, description, torrents=None):
         self.id = id
         self.name = name
         self.description = description
-        self.torrents = set()
+        self.torrents = torrents if torrents is not None else set()
 
     def add_torrent(self, torrent):
         self.torrents.add(torrent)
@@ -29,3 +31,13 @@ class Playlist:
             torrents_json.append(torrent_json)
 
         return {"id": self.id, "name": self.name, "description": self.description, "torrents": torrents_json}
+
+    def get_json_fragment(self):
+        """
+        Returns the JSON encoding of get_json, assembled from the cached fragments of the torrents.
+        """
+        family_filter = tribler_utils.tribler_data.settings["settings"]["general"]["family_filter"]
+        torrent_fragments = [torrent.get_json_fragment() for torrent in self.torrents
+                             if not (family_filter and torrent.category == 'xxx')]
+        playlist_json = json.dumps({"id": self.id, "name": self.name, "description": self.description})
+        return playlist_json[:-1] + ', "torrents": [%s]}' % ", ".join(torrent_fragments)
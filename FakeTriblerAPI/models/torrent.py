@@ -1,24 +1,58 @@
-from random import randint, uniform
-import binascii
+import json
+from random import random
 import time
 
+import FakeTriblerAPI.tribler_utils as tribler_utils
+from FakeTriblerAPI.utils import get_random_int
 
-class Torrent:
+
+class Torrent(object):
+
+    __slots__ = ('id', 'infohash', 'name', 'length', 'category', '_files', 'time_added', 'relevance_score',
+                 'num_seeders', 'num_leechers', '_json_prefix')
 
     def __init__(self, id, infohash, name, length, category):
         self.id = id
-        self.infohash = binascii.a2b_base64(infohash).encode('hex')
+        self.infohash = infohash
         self.name = name
         self.length = int(length)
         self.category = category
-        self.files = []
-        self.time_added = randint(1200000000, 1460000000)
-        self.relevance_score = uniform(0, 20)
+        self._files = None
+        self.time_added = get_random_int(1200000000, 1460000000)
+        self.relevance_score = random() * 20
+
+        self.num_seeders = get_random_int(0, 500) if random() < 0.5 else 0
+        self.num_leechers = get_random_int(0, 500) if random() < 0.5 else 0
+        self._json_prefix = None
 
-        self.num_seeders = randint(0, 500) if randint(0, 1) == 0 else 0
-        self.num_leechers = randint(0, 500) if randint(0, 1) == 0 else 0
+    @property
+    def files(self):
+        """
+        The files of this torrent, loaded from the files index of the Tribler data on first access.
+        """
+        if self._files is not None:
+            return self._files
+        return tribler_utils.tribler_data.torrent_files.get_files(self.id)
+
+    @files.setter
+    def files(self, files):
+        self._files = files
 
     def get_json(self):
         return {"name": self.name, "infohash": self.infohash, "size": self.length, "category": self.category,
                 "relevance_score": self.relevance_score, "num_seeders": self.num_seeders,
                 "num_leechers": self.num_leechers, "last_tracker_check": time.time()}
+
+    def get_json_fragment(self, relevance_score=None):
+        """
+        Returns the JSON encoding of get_json, optionally with the given relevance score. Everything but the relevance
+        score and the last tracker check is encoded once and cached, these are spliced in on every call.
+        """
+        if self._json_prefix is None:
+            torrent_json = self.get_json()
+            del torrent_json["relevance_score"]
+            del torrent_json["last_tracker_check"]
+            self._json_prefix = json.dumps(torrent_json)[:-1] + ', "relevance_score": '
+        if relevance_score is None:
+            relevance_score = self.relevance_score
+        return self._json_prefix + repr(relevance_score) + ', "last_tracker_check": ' + repr(time.time()) + '}'
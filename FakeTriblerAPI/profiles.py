@@ -0,0 +1,93 @@
+"""
+This module contains the scale profiles that determine how much data is generated by TriblerData.
+
+A profile is selected by name, either explicitly or through the FAKE_TRIBLER_PROFILE environment variable. Every
+profile has a default seed so that runs are reproducible; FAKE_TRIBLER_SEED overrides this seed.
+"""
+import os
+
+PROFILE_ENV_VARIABLE = "FAKE_TRIBLER_PROFILE"
+SEED_ENV_VARIABLE = "FAKE_TRIBLER_SEED"
+
+DEFAULT_PROFILE = "default"
+DEFAULT_SEED = 42
+
+# Every size is an inclusive (min, max) range. The number of torrents is None when only the torrents in the corpus
+# are used, larger numbers are reached by duplicating corpus torrents with fresh infohashes. The number of
+# channel torrents is the maximum number of torrents in a single channel, None means that a channel can contain
+# (almost) every torrent.
+PROFILES = {
+    "default": {
+        "torrents": None,
+        "channels": (100, 200),
+        "channel_torrents": None,
+        "subscribed_channels": (10, 50),
+        "downloads": (10, 30),
+        "rss_feeds": (10, 30),
+        "trustchain_blocks": (100, 100),
+        "ticks": (20, 50),
+        "transactions": (20, 50),
+        "orders": (20, 50),
+    },
+    "small": {
+        "torrents": 500,
+        "channels": (10, 20),
+        "channel_torrents": 50,
+        "subscribed_channels": (2, 5),
+        "downloads": (3, 5),
+        "rss_feeds": (1, 3),
+        "trustchain_blocks": (10, 10),
+        "ticks": (5, 10),
+        "transactions": (5, 10),
+        "orders": (5, 10),
+    },
+    "large": {
+        "torrents": 100000,
+        "channels": (10000, 10000),
+        "channel_torrents": 200,
+        "subscribed_channels": (500, 500),
+        "downloads": (1000, 1000),
+        "rss_feeds": (100, 100),
+        "trustchain_blocks": (1000, 1000),
+        "ticks": (500, 500),
+        "transactions": (500, 500),
+        "orders": (500, 500),
+    },
+    "xl": {
+        "torrents": 1000000,
+        "channels": (100000, 100000),
+        "channel_torrents": 100,
+        "subscribed_channels": (1000, 1000),
+        "downloads": (10000, 10000),
+        "rss_feeds": (100, 100),
+        "trustchain_blocks": (10000, 10000),
+        "ticks": (1000, 1000),
+        "transactions": (1000, 1000),
+        "orders": (1000, 1000),
+    },
+}
+
+
+def get_profile_name(name=None):
+    """
+    Returns the name of the profile to use, falling back to the environment and then to the default profile.
+    """
+    name = name or os.environ.get(PROFILE_ENV_VARIABLE) or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError("unknown profile %s, choose from %s" % (name, ", ".join(sorted(PROFILES))))
+    return name
+
+
+def get_profile(name=None):
+    return PROFILES[get_profile_name(name)]
+
+
+def get_seed(seed=None):
+    """
+    Returns the seed to use, falling back to the environment and then to the default seed.
+    """
+    if seed is not None:
+        return int(seed)
+    if os.environ.get(SEED_ENV_VARIABLE):
+        return int(os.environ[SEED_ENV_VARIABLE])
+    return DEFAULT_SEED
@@ -0,0 +1,106 @@
+"""
+This module contains a monitor that samples the CPU usage and memory use of the fake API process itself.
+
+The samples are kept in ring buffers of a fixed size, so the monitor can run for as long as the fake API does. They are
+served by the CPU and memory history endpoints, which lets the resource graphs of the GUI show the fake API during soak
+tests.
+"""
+from collections import deque
+import resource
+import sys
+import time
+
+from twisted.internet.task import LoopingCall
+
+# The number of seconds between two samples
+SAMPLE_INTERVAL = 5.0
+
+# The number of samples that is kept, one hour at the default interval
+HISTORY_SIZE = 720
+
+STATM_PATH = "/proc/self/statm"
+
+
+def get_cpu_time():
+    """
+    Returns the number of seconds of CPU time used by this process, in user and system mode.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_rss():
+    """
+    Returns the resident set size of this process in bytes. If /proc is not available, the peak resident set size is
+    returned instead.
+    """
+    try:
+        with open(STATM_PATH) as statm_file:
+            return int(statm_file.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def downsample(samples, max_points=None):
+    """
+    Returns at most max_points of the given (time, value) samples, by averaging runs of consecutive samples. The time
+    of an averaged point is the time of the last sample in its run.
+    """
+    samples = list(samples)
+    if max_points is None or len(samples) <= max_points:
+        return samples
+
+    step = float(len(samples)) / max_points
+    points = []
+    for index in xrange(max_points):
+        run = samples[int(index * step):int((index + 1) * step)]
+        points.append((run[-1][0], sum(value for _, value in run) / float(len(run))))
+    return points
+
+
+class ResourceMonitor(object):
+    """
+    Samples the CPU usage, as a percentage of a single core, and the resident set size of this process.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.cpu_history = deque(maxlen=history_size)
+        self.memory_history = deque(maxlen=history_size)
+        self.last_sample_time = None
+        self.last_cpu_time = None
+        self.looping_call = None
+
+    @property
+    def running(self):
+        return self.looping_call is not None
+
+    def sample(self):
+        now = time.time()
+        cpu_time = get_cpu_time()
+        # The CPU usage is measured over the time since the previous sample
+        if self.last_sample_time is not None and now > self.last_sample_time:
+            self.cpu_history.append((now, 100.0 * (cpu_time - self.last_cpu_time) / (now - self.last_sample_time)))
+        self.memory_history.append((now, get_rss()))
+        self.last_sample_time = now
+        self.last_cpu_time = cpu_time
+
+    def get_cpu_history(self, max_points=None):
+        return [{"time": sample_time, "cpu": cpu} for sample_time, cpu in downsample(self.cpu_history, max_points)]
+
+    def get_memory_history(self, max_points=None):
+        return [{"time": sample_time, "mem": memory}
+                for sample_time, memory in downsample(self.memory_history, max_points)]
+
+    def start(self, interval=SAMPLE_INTERVAL):
+        """
+        Starts sampling on the reactor every interval seconds.
+        """
+        if self.looping_call is None:
+            self.looping_call = LoopingCall(self.sample)
+            self.looping_call.start(interval, now=True)
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
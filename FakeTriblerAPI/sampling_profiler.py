@@ -0,0 +1,97 @@
+"""
+This module contains a statistical profiler that samples the stacks of all threads of the fake API.
+
+A background thread looks at the current frame of every other thread at a fixed interval and counts the stacks it
+sees. Nothing is traced while the profiler runs, so its overhead is the sampling itself and it can be started on a
+fake API that is already under load. The results are collapsed stacks, one line per distinct stack with the number of
+times it was sampled, as used by flame graph tools, and the functions that were most often at the top of a stack.
+"""
+from collections import defaultdict
+import os
+import sys
+import threading
+import time
+
+# The number of seconds between two samples
+SAMPLE_INTERVAL = 0.005
+
+
+def get_frame_label(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class SamplingProfiler(object):
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stack_counts = defaultdict(int)
+        self.num_samples = 0
+        self.start_time = None
+        self.stop_time = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and not self.stopped.is_set()
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self.run, name="SamplingProfiler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.stop_time = time.time()
+
+    def run(self):
+        own_thread_id = threading.current_thread().ident
+        while not self.stopped.wait(self.interval):
+            thread_names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().iteritems():
+                if thread_id == own_thread_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(get_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(thread_names.get(thread_id, "thread %d" % thread_id))
+                self.stack_counts[tuple(reversed(labels))] += 1
+            self.num_samples += 1
+
+    def get_collapsed_stacks(self):
+        """
+        Returns the sampled stacks in the collapsed format of flame graph tools: the frames of a stack from the thread
+        to the innermost function separated by semicolons, followed by the number of samples of the stack.
+        """
+        return "".join("%s %d\n" % (";".join(stack), count)
+                       for stack, count in sorted(self.stack_counts.iteritems(), key=lambda item: -item[1]))
+
+    def get_sample_time(self):
+        """
+        Returns the number of seconds per sample. Samples can be taken less often than the interval when the sampling
+        thread has to wait for the GIL, so this is measured rather than assumed.
+        """
+        return ((self.stop_time or time.time()) - self.start_time) / max(self.num_samples, 1)
+
+    def get_top_functions(self, limit):
+        """
+        Returns the functions that were most often at the top of a sampled stack, with an estimate of their self time
+        and their total time (including the time in the functions they call) in seconds.
+        """
+        sample_time = self.get_sample_time()
+        self_counts = defaultdict(int)
+        total_counts = defaultdict(int)
+        for stack, count in self.stack_counts.iteritems():
+            self_counts[stack[-1]] += count
+            for label in set(stack[1:]):
+                total_counts[label] += count
+
+        top_functions = sorted(self_counts.iteritems(), key=lambda item: -item[1])[:limit]
+        return [{"function": label, "self_samples": count, "self_time": count * sample_time,
+                 "total_samples": total_counts[label], "total_time": total_counts[label] * sample_time}
+                for label, count in top_functions]
@@ -0,0 +1,225 @@
+"""
+This module contains an inverted index for full-text search over the names of torrents and channels.
+
+Documents are identified by an integer id (the index of a torrent or channel in the Tribler data). Queries match the
+documents that contain all query tokens and are ranked with BM25.
+
+Documents with the same text always get the same score, so the postings lists refer to distinct texts and every text
+keeps the ids of its documents. This keeps the index small and queries fast when many torrents share a name, which is
+the case for the synthetic torrents of the larger profiles.
+"""
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+from itertools import izip
+from math import log
+from operator import itemgetter
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Postings lists with at least this many texts cache their best scoring texts the first time they are queried, so that
+# repeated single-token queries for common tokens do not have to score every text.
+LARGE_POSTINGS_SIZE = 2000
+TOP_TEXTS_SIZE = 500
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex(object):
+
+    def __init__(self):
+        self.texts = []
+        self.text_ids = {}
+        self.text_documents = []
+        self.text_lengths = array('H')
+        self.postings = {}
+        self.frequencies = {}
+        self.document_frequencies = {}
+        self.top_texts = {}
+        self.num_documents = 0
+        self.total_length = 0
+        self.next_document_id = 0
+
+    def __len__(self):
+        return self.num_documents
+
+    def get_text_id(self, text, tokens=None):
+        text_id = self.text_ids.get(text)
+        if text_id is not None:
+            return text_id
+
+        tokens = tokens or tokenize(text)
+        text_id = self.text_ids[text] = len(self.texts)
+        self.texts.append(text)
+        self.text_documents.append(array('I'))
+        self.text_lengths.append(min(len(tokens), 0xFFFF))
+        for token in set(tokens):
+            if token not in self.postings:
+                self.postings[token] = array('I')
+                self.frequencies[token] = array('B')
+                self.document_frequencies[token] = 0
+            self.postings[token].append(text_id)
+            self.frequencies[token].append(min(tokens.count(token), 0xFF))
+        return text_id
+
+    def update_counts(self, text_id, count, tokens=None):
+        """
+        Updates the statistics used for scoring after count documents have been added with the given text, or removed
+        when count is negative.
+        """
+        self.num_documents += count
+        self.total_length += count * self.text_lengths[text_id]
+        for token in set(tokens or tokenize(self.texts[text_id])):
+            self.document_frequencies[token] += count
+            self.top_texts.pop(token, None)
+
+    def add_document(self, document_id, text):
+        """
+        Adds the given text under the given document id.
+        """
+        tokens = tokenize(text)
+        text_id = self.get_text_id(text, tokens=tokens)
+        documents = self.text_documents[text_id]
+        if not documents or documents[-1] < document_id:
+            documents.append(document_id)
+        else:
+            documents.insert(bisect_left(documents, document_id), document_id)
+        self.update_counts(text_id, 1, tokens=tokens)
+        self.next_document_id = max(self.next_document_id, document_id + 1)
+
+    def add_documents(self, texts):
+        """
+        Adds the given texts with consecutive document ids, starting right after the highest document id in the index.
+        """
+        counts = {}
+        document_id = self.next_document_id
+        for text in texts:
+            text_id = self.get_text_id(text)
+            self.text_documents[text_id].append(document_id)
+            counts[text_id] = counts.get(text_id, 0) + 1
+            document_id += 1
+        self.next_document_id = document_id
+
+        for text_id, count in counts.iteritems():
+            self.update_counts(text_id, count)
+
+    def remove_document(self, document_id, text):
+        """
+        Removes the document with the given id, which has been added with the given text.
+        """
+        text_id = self.text_ids[text]
+        documents = self.text_documents[text_id]
+        del documents[bisect_left(documents, document_id)]
+        self.update_counts(text_id, -1)
+
+    def get_idf(self, token):
+        document_frequency = self.document_frequencies[token]
+        return log(1 + (self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def score_token(self, token):
+        """
+        Returns (text id, score) tuples for all texts that contain the given token.
+        """
+        idf = self.get_idf(token)
+        average_length = float(self.total_length) / max(self.num_documents, 1)
+        text_lengths = self.text_lengths
+        return [(text_id, idf * frequency * (K1 + 1) /
+                 (frequency + K1 * (1 - B + B * text_lengths[text_id] / average_length)))
+                for text_id, frequency in izip(self.postings[token], self.frequencies[token])]
+
+    def score_tokens(self, tokens):
+        """
+        Returns (text id, score) tuples for all texts that contain all given tokens.
+        """
+        # Intersect the postings lists, starting with the shortest one. Short candidate lists are looked up in the
+        # other postings lists, long ones are intersected as sets.
+        tokens = sorted(tokens, key=lambda token: len(self.postings[token]))
+        candidates = self.postings[tokens[0]]
+        for token in tokens[1:]:
+            postings = self.postings[token]
+            if len(candidates) * 16 < len(postings):
+                candidates = [text_id for text_id in candidates if self.contains(postings, text_id)]
+            else:
+                candidates = set(candidates).intersection(postings)
+
+        idfs = [(self.postings[token], self.frequencies[token], self.get_idf(token)) for token in tokens]
+        average_length = float(self.total_length) / max(self.num_documents, 1)
+        scores = []
+        for text_id in candidates:
+            norm = K1 * (1 - B + B * self.text_lengths[text_id] / average_length)
+            score = 0
+            for postings, frequencies, idf in idfs:
+                frequency = frequencies[bisect_left(postings, text_id)]
+                score += idf * frequency * (K1 + 1) / (frequency + norm)
+            scores.append((text_id, score))
+        return scores
+
+    def get_documents(self, text_scores, limit, accept=None):
+        """
+        Expands the given (text id, score) tuples, ordered by descending score, to at most limit (document id, score)
+        tuples of accepted documents.
+        """
+        results = []
+        for text_id, score in text_scores:
+            for document_id in self.text_documents[text_id]:
+                if accept is None or accept(document_id):
+                    results.append((document_id, score))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def search(self, query, limit, accept=None):
+        """
+        Returns at most limit (document id, score) tuples of the documents that contain all tokens in the query,
+        ordered by descending BM25 score. If given, accept is called with a document id to filter the results.
+        """
+        tokens = set(tokenize(query))
+        if not tokens or limit <= 0 or any(token not in self.postings for token in tokens):
+            return []
+
+        if len(tokens) == 1:
+            token = tokens.pop()
+            if len(self.postings[token]) >= LARGE_POSTINGS_SIZE:
+                top_texts = self.top_texts.get(token)
+                if top_texts is None:
+                    top_texts = self.top_texts[token] = nlargest(TOP_TEXTS_SIZE, self.score_token(token),
+                                                                 key=itemgetter(1))
+                results = self.get_documents(top_texts, limit, accept=accept)
+                if len(results) >= limit:
+                    return results
+            text_scores = self.score_token(token)
+        else:
+            text_scores = self.score_tokens(tokens)
+
+        # Most queries are answered by the best scoring texts, only sort all texts when too many documents are rejected
+        results = self.get_documents(nlargest(limit, text_scores, key=itemgetter(1)), limit, accept=accept)
+        if len(results) < limit and len(text_scores) > limit:
+            text_scores.sort(key=itemgetter(1), reverse=True)
+            results = self.get_documents(text_scores, limit, accept=accept)
+        return results
+
+    def search_texts(self, query, limit, accept=None):
+        """
+        Returns at most limit (text, score) tuples of the distinct texts that contain all tokens in the query, ordered
+        by descending BM25 score. If given, accept is called with the first document id of a text to filter the results.
+        """
+        tokens = set(tokenize(query))
+        if not tokens or limit <= 0 or any(token not in self.postings for token in tokens):
+            return []
+
+        text_scores = self.score_token(tokens.pop()) if len(tokens) == 1 else self.score_tokens(tokens)
+        text_scores = [(text_id, score) for text_id, score in text_scores if self.text_documents[text_id] and
+                       (accept is None or accept(self.text_documents[text_id][0]))]
+        return [(self.texts[text_id], score) for text_id, score in nlargest(limit, text_scores, key=itemgetter(1))]
+
+    @staticmethod
+    def contains(postings, text_id):
+        position = bisect_left(postings, text_id)
+        return position < len(postings) and postings[position] == text_id
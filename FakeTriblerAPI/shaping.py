@@ -0,0 +1,308 @@
+"""
+This module contains a site that delays responses and limits their bandwidth per route, to simulate a slow Tribler core.
+
+The shaping of a route consists of a delay distribution and an optional bandwidth cap. The delay is drawn for every
+request and waited before the resource is rendered. With a bandwidth cap, the response body is written in chunks that
+are spaced out so the body is sent at the given number of bytes per second. Both are implemented with deferLater, so
+delayed and throttled requests only cost a pending call on the reactor and thousands of them can be in flight at once.
+
+The shaping is read from a JSON file that maps routes, as used by the metrics (see FakeTriblerAPI/metrics.py), or
+fnmatch patterns of routes to their shaping, for example:
+
+    {
+        "/downloads": {"delay": {"distribution": "lognormal", "median": 0.2, "sigma": 0.5}, "bandwidth": 50000},
+        "/channels/discovered/*": {"delay": {"distribution": "uniform", "min": 0.1, "max": 1.0}},
+        "*": {"delay": {"distribution": "fixed", "seconds": 0.05}}
+    }
+
+A route uses the shaping of its exact entry if there is one, otherwise that of the longest pattern it matches.
+"""
+from collections import deque
+from fnmatch import fnmatch
+import json
+from math import log
+import random
+
+from twisted.internet import defer, task
+from twisted.python import failure
+
+from FakeTriblerAPI.metrics import MetricsRequest, MetricsSite
+
+# Delays are never longer than this number of seconds, which bounds the tail of the log-normal distribution
+MAX_DELAY = 60.0
+
+# The number of bytes that is written at once when the bandwidth of a response is capped
+BANDWIDTH_CHUNK_SIZE = 16 * 1024
+
+# The producer of a response with a capped bandwidth is paused when this many bytes are waiting to be written
+MAX_QUEUED_BYTES = 64 * 1024
+
+
+class FixedDelay(object):
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def get_delay(self):
+        return self.seconds
+
+
+class UniformDelay(object):
+
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def get_delay(self):
+        return random.uniform(self.minimum, self.maximum)
+
+
+class LogNormalDelay(object):
+    """
+    A log-normal delay, which has the long tail of the response times of a real service. Half of the delays are below
+    the median, sigma determines the length of the tail.
+    """
+
+    def __init__(self, median, sigma):
+        self.mu = log(median)
+        self.sigma = sigma
+
+    def get_delay(self):
+        return random.lognormvariate(self.mu, self.sigma)
+
+
+def parse_delay(config):
+    """
+    Returns the delay distribution described by the given dictionary. Raises a ValueError if it is not valid.
+    """
+    distribution = config.get("distribution")
+    try:
+        if distribution == "fixed":
+            delay = FixedDelay(float(config["seconds"]))
+            valid = delay.seconds >= 0
+        elif distribution == "uniform":
+            delay = UniformDelay(float(config["min"]), float(config["max"]))
+            valid = 0 <= delay.minimum <= delay.maximum
+        elif distribution == "lognormal":
+            median = float(config["median"])
+            valid = median > 0
+            delay = LogNormalDelay(median, float(config["sigma"])) if valid else None
+        else:
+            raise ValueError("unknown delay distribution %s, choose from fixed, uniform and lognormal" % distribution)
+    except (KeyError, TypeError) as error:
+        raise ValueError("invalid %s delay: %s" % (distribution, error))
+    if not valid:
+        raise ValueError("invalid %s delay, delays can not be negative" % distribution)
+    return delay
+
+
+class RouteShaping(object):
+
+    def __init__(self, delay=None, bandwidth=None):
+        self.delay = delay
+        self.bandwidth = bandwidth
+
+    def get_delay(self):
+        return min(self.delay.get_delay(), MAX_DELAY) if self.delay is not None else 0
+
+
+class Shaping(object):
+    """
+    The shaping of all routes.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes or {}
+        self.patterns = sorted((route for route in self.routes if any(char in route for char in "*?[")),
+                               key=len, reverse=True)
+        self.cache = {}
+
+    @staticmethod
+    def from_dictionary(config):
+        """
+        Returns the shaping described by the given dictionary, see the module documentation. Raises a ValueError if
+        it is not valid.
+        """
+        routes = {}
+        for route, route_config in config.iteritems():
+            bandwidth = route_config.get("bandwidth")
+            if bandwidth is not None and (not isinstance(bandwidth, (int, long, float)) or bandwidth <= 0):
+                raise ValueError("the bandwidth of %s should be a positive number of bytes per second" % route)
+            delay = parse_delay(route_config["delay"]) if "delay" in route_config else None
+            routes[route] = RouteShaping(delay=delay, bandwidth=bandwidth)
+        return Shaping(routes)
+
+    @staticmethod
+    def from_file(path):
+        with open(path) as config_file:
+            return Shaping.from_dictionary(json.load(config_file))
+
+    def get_route_shaping(self, route):
+        """
+        Returns the shaping of the given route, or None if it is not shaped.
+        """
+        if route not in self.cache:
+            shaping = self.routes.get(route)
+            if shaping is None:
+                shaping = next((self.routes[pattern] for pattern in self.patterns if fnmatch(route, pattern)), None)
+            self.cache[route] = shaping
+        return self.cache[route]
+
+
+class ShapedRequest(MetricsRequest):
+    """
+    A request that is rendered after the delay of its route, and whose body is written at the bandwidth of its route.
+
+    When the bandwidth is capped, the producer of the response is not registered with the connection, since the
+    written data waits in this request rather than in the transport. The request pauses and resumes the producer
+    instead, depending on the number of bytes that are waiting to be written.
+    """
+
+    def __init__(self, *args, **kwargs):
+        MetricsRequest.__init__(self, *args, **kwargs)
+        self.shaping = None
+        self.pending = []
+        self.chunks = deque()
+        self.sending = False
+        self.queued_bytes = 0
+        self.finishing = False
+        self.lost = False
+        self.shaped_producer = None
+        self.shaped_producer_streaming = False
+        self.shaped_producer_paused = False
+        self.pulling = False
+
+    @property
+    def bandwidth(self):
+        return self.shaping.bandwidth if self.shaping is not None else None
+
+    def process(self):
+        self.notifyFinish().addErrback(self.on_connection_lost)
+        MetricsRequest.process(self)
+
+    def schedule(self, delay, function, *args):
+        """
+        Calls the given function after the given number of seconds, unless the connection is lost before.
+        """
+        deferred = task.deferLater(self.site.clock, delay, function, *args)
+        self.pending.append(deferred)
+        deferred.addBoth(self.on_called, deferred)
+        deferred.addErrback(lambda reason: reason.trap(defer.CancelledError))
+
+    def on_called(self, result, deferred):
+        self.pending.remove(deferred)
+        return result
+
+    def render(self, resrc):
+        self.shaping = self.site.shaping.get_route_shaping(self.route)
+        delay = self.shaping.get_delay() if self.shaping is not None else 0
+        if delay <= 0:
+            MetricsRequest.render(self, resrc)
+        else:
+            self.schedule(delay, self.render_delayed, resrc)
+
+    def render_delayed(self, resrc):
+        try:
+            MetricsRequest.render(self, resrc)
+        except Exception:
+            self.processingFailed(failure.Failure())
+
+    def write(self, data):
+        if not self.bandwidth or not data:
+            MetricsRequest.write(self, data)
+            return
+
+        for offset in xrange(0, len(data), BANDWIDTH_CHUNK_SIZE):
+            self.chunks.append(data[offset:offset + BANDWIDTH_CHUNK_SIZE])
+        self.queued_bytes += len(data)
+        if not self.sending:
+            self.schedule_chunk()
+        self.update_producer()
+
+    def schedule_chunk(self):
+        """
+        Writes the first queued chunk once it would have been sent at the bandwidth. Only one chunk is scheduled at a
+        time, so the chunks are written in order.
+        """
+        self.sending = True
+        self.schedule(float(len(self.chunks[0])) / self.bandwidth, self.write_chunk)
+
+    def write_chunk(self):
+        chunk = self.chunks.popleft()
+        self.queued_bytes -= len(chunk)
+        MetricsRequest.write(self, chunk)
+        if self.chunks:
+            self.schedule_chunk()
+        else:
+            self.sending = False
+            if self.finishing:
+                MetricsRequest.finish(self)
+                return
+        self.update_producer()
+
+    def finish(self):
+        # A request with chunks that are waiting to be written is finished after writing the last chunk
+        if self.queued_bytes:
+            self.finishing = True
+        else:
+            MetricsRequest.finish(self)
+
+    def registerProducer(self, producer, streaming):
+        if not self.bandwidth:
+            MetricsRequest.registerProducer(self, producer, streaming)
+            return
+        self.shaped_producer = producer
+        self.shaped_producer_streaming = streaming
+        self.shaped_producer_paused = False
+        self.update_producer()
+
+    def unregisterProducer(self):
+        if self.shaped_producer is None:
+            MetricsRequest.unregisterProducer(self)
+        self.shaped_producer = None
+
+    def update_producer(self):
+        """
+        Pauses a push producer when too many bytes are waiting to be written and resumes it otherwise, or asks a pull
+        producer for more data.
+        """
+        producer = self.shaped_producer
+        if producer is None or self.lost:
+            return
+
+        if self.shaped_producer_streaming:
+            if self.queued_bytes >= MAX_QUEUED_BYTES and not self.shaped_producer_paused:
+                self.shaped_producer_paused = True
+                producer.pauseProducing()
+            elif self.queued_bytes < MAX_QUEUED_BYTES and self.shaped_producer_paused:
+                self.shaped_producer_paused = False
+                producer.resumeProducing()
+        elif self.queued_bytes < MAX_QUEUED_BYTES and not self.pulling:
+            # A pull producer writes from resumeProducing, which calls this method again
+            self.pulling = True
+            try:
+                producer.resumeProducing()
+            finally:
+                self.pulling = False
+
+    def on_connection_lost(self, _):
+        self.lost = True
+        for deferred in list(self.pending):
+            deferred.cancel()
+        if self.shaped_producer is not None:
+            self.shaped_producer.stopProducing()
+            self.shaped_producer = None
+
+
+class ShapedSite(MetricsSite):
+    """
+    A site that shapes the responses of its routes, and keeps metrics of them including the shaping. Delays are
+    scheduled on the given clock, which is normally the reactor.
+    """
+
+    requestFactory = ShapedRequest
+
+    def __init__(self, root_resource, shaping, clock, *args, **kwargs):
+        MetricsSite.__init__(self, root_resource, *args, **kwargs)
+        self.shaping = shaping
+        self.clock = clock
@@ -0,0 +1,94 @@
+"""
+This module contains indexes that materialize the files of a torrent on first access.
+
+The files of most torrents are never requested, so instead of building a list of files for every torrent up front,
+these indexes only keep the location of the files of each torrent, either as a row range in a compiled snapshot or as
+a byte range in torrent_files.dat.
+"""
+from collections import OrderedDict
+
+
+class TorrentFilesIndex(object):
+    """
+    Base class for the files indexes. Materialized file lists are kept in a cache that is optionally bounded to the
+    given number of torrents, in which case the least recently used file lists are evicted first.
+    """
+
+    def __init__(self, cache_size=None):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def load_files(self, torrent_id):
+        """
+        Reads the list of files of the torrent with the given id, or returns an empty list for an unknown torrent.
+        Implemented by the subclasses.
+        """
+        raise NotImplementedError()
+
+    def get_files(self, torrent_id):
+        """
+        Returns the list of files of the torrent with the given id.
+        """
+        files = self.cache.pop(torrent_id, None)
+        if files is None:
+            files = self.load_files(torrent_id)
+            if self.cache_size is not None and len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[torrent_id] = files
+        return files
+
+
+class SnapshotTorrentFilesIndex(TorrentFilesIndex):
+    """
+    Files index on top of a compiled torrent snapshot.
+    """
+
+    def __init__(self, snapshot, cache_size=None):
+        super(SnapshotTorrentFilesIndex, self).__init__(cache_size=cache_size)
+        self.snapshot = snapshot
+        self.rows = dict((torrent_id, row) for row, torrent_id in enumerate(snapshot.iter_torrent_ids()))
+
+    def load_files(self, torrent_id):
+        if torrent_id not in self.rows:
+            return []
+        return self.snapshot.get_files(self.rows[torrent_id])
+
+
+class DatTorrentFilesIndex(TorrentFilesIndex):
+    """
+    Files index on top of torrent_files.dat. The lines of a torrent are stored consecutively in this file, so every
+    torrent id maps to a single byte range.
+    """
+
+    def __init__(self, path, cache_size=None):
+        super(DatTorrentFilesIndex, self).__init__(cache_size=cache_size)
+        self.path = path
+        self.ranges = {}
+
+        offset = 0
+        with open(path, "rb") as torrent_files_file:
+            for line in torrent_files_file:
+                if not line.strip():
+                    offset += len(line)
+                    continue
+                torrent_id = line[:line.find("\t")]
+                if torrent_id in self.ranges:
+                    self.ranges[torrent_id][1] = offset + len(line)
+                else:
+                    self.ranges[torrent_id] = [offset, offset + len(line)]
+                offset += len(line)
+
+    def load_files(self, torrent_id):
+        if torrent_id not in self.ranges:
+            return []
+
+        start, end = self.ranges[torrent_id]
+        with open(self.path, "rb") as torrent_files_file:
+            torrent_files_file.seek(start)
+            lines = torrent_files_file.read(end - start).splitlines()
+
+        files = []
+        for line in lines:
+            _, path, length = line.split("\t")
+            files.append({"path": path, "length": int(length)})
+        return files
@@ -0,0 +1,294 @@
+"""
+This module compiles the torrent corpus (random_torrents.dat and torrent_files.dat) into a binary snapshot.
+
+The snapshot is a single file that can be memory-mapped. It starts with a fixed-size header, followed by fixed-width
+columns for the torrents and their files and an offset-indexed heap that holds all strings (names, paths and
+categories). Loading a snapshot avoids splitting every line and base64-decoding every infohash on startup.
+
+Run this module to (re)build the snapshot: python -m FakeTriblerAPI.torrent_snapshot
+"""
+import binascii
+import mmap
+import os
+import struct
+import tempfile
+
+import FakeTriblerAPI
+
+SNAPSHOT_MAGIC = "FTRBSNAP"
+SNAPSHOT_VERSION = 1
+
+# magic, version, reserved, num_torrents, num_files, num_categories, heap_size,
+# size and mtime (in microseconds) of random_torrents.dat, size and mtime of torrent_files.dat
+HEADER_FORMAT = "<8sHHIIIIqqqq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+INFOHASH_SIZE = 20
+
+
+def get_data_dir():
+    return os.path.join(os.path.dirname(FakeTriblerAPI.__file__), "data")
+
+
+def get_default_paths():
+    """
+    Returns the paths of the torrents file, the torrent files file and the snapshot in the data directory.
+    """
+    data_dir = get_data_dir()
+    return (os.path.join(data_dir, "random_torrents.dat"), os.path.join(data_dir, "torrent_files.dat"),
+            os.path.join(data_dir, "torrents.snapshot"))
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _get_fingerprint(path):
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime * 1000000)
+
+
+def _get_layout(num_torrents, num_files, num_categories):
+    """
+    Computes the offset of every section in the snapshot. Every section is 8-byte aligned.
+    """
+    sections = [("torrent_ids", 4 * num_torrents),
+                ("torrent_infohashes", INFOHASH_SIZE * num_torrents),
+                ("torrent_lengths", 8 * num_torrents),
+                ("torrent_categories", num_torrents),
+                ("torrent_names", 4 * (num_torrents + 1)),
+                ("torrent_files_start", 4 * (num_torrents + 1)),
+                ("file_lengths", 8 * num_files),
+                ("file_paths", 4 * (num_files + 1)),
+                ("categories", 4 * (num_categories + 1))]
+
+    layout = {}
+    offset = _align(HEADER_SIZE)
+    for name, size in sections:
+        layout[name] = offset
+        offset = _align(offset + size)
+    layout["heap"] = offset
+    return layout
+
+
+def read_torrents_file(path):
+    """
+    Parses the torrents file and returns a list of (id, raw infohash, name, length, category) tuples.
+    """
+    torrents = []
+    with open(path) as torrents_file:
+        for line in torrents_file:
+            line = line.rstrip()
+            if not line:
+                continue
+            torrent_id, infohash, name, length, category = line.split("\t")
+            torrents.append((int(torrent_id), binascii.a2b_base64(infohash), name, int(length), category))
+    return torrents
+
+
+def read_torrent_files_file(path):
+    """
+    Parses the torrent files file and returns a dictionary from torrent id to a list of (path, length) tuples.
+    """
+    torrent_files = {}
+    with open(path) as torrent_files_file:
+        for line in torrent_files_file:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            torrent_id, file_path, length = line.split("\t")
+            torrent_files.setdefault(int(torrent_id), []).append((file_path, int(length)))
+    return torrent_files
+
+
+def compile_snapshot(torrents_path, torrent_files_path, snapshot_path):
+    """
+    Compiles the torrents file and the torrent files file into a snapshot at the given path.
+    The snapshot is written to a temporary file of its own first and then moved in place, so processes that compile
+    the snapshot at the same time never see a partially written snapshot.
+    """
+    torrents = read_torrents_file(torrents_path)
+    torrent_files = read_torrent_files_file(torrent_files_path)
+
+    categories = sorted(set(torrent[4] for torrent in torrents))
+    category_indices = dict((category, index) for index, category in enumerate(categories))
+
+    heap = []
+    heap_size = [0]
+
+    def add_to_heap(string):
+        offset = heap_size[0]
+        heap.append(string)
+        heap_size[0] += len(string)
+        return offset
+
+    name_offsets = [add_to_heap(torrent[2]) for torrent in torrents]
+    name_offsets.append(heap_size[0])
+
+    files_start = []
+    file_lengths = []
+    path_offsets = []
+    for torrent in torrents:
+        files_start.append(len(file_lengths))
+        for file_path, file_length in torrent_files.get(torrent[0], []):
+            path_offsets.append(add_to_heap(file_path))
+            file_lengths.append(file_length)
+    files_start.append(len(file_lengths))
+    path_offsets.append(heap_size[0])
+
+    category_offsets = [add_to_heap(category) for category in categories]
+    category_offsets.append(heap_size[0])
+
+    num_torrents = len(torrents)
+    num_files = len(file_lengths)
+    layout = _get_layout(num_torrents, num_files, len(categories))
+
+    header = struct.pack(HEADER_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, num_torrents, num_files,
+                         len(categories), heap_size[0],
+                         *(_get_fingerprint(torrents_path) + _get_fingerprint(torrent_files_path)))
+    sections = [("torrent_ids", struct.pack("<%dI" % num_torrents, *[torrent[0] for torrent in torrents])),
+                ("torrent_infohashes", "".join(torrent[1] for torrent in torrents)),
+                ("torrent_lengths", struct.pack("<%dQ" % num_torrents, *[torrent[3] for torrent in torrents])),
+                ("torrent_categories", struct.pack("<%dB" % num_torrents,
+                                                   *[category_indices[torrent[4]] for torrent in torrents])),
+                ("torrent_names", struct.pack("<%dI" % len(name_offsets), *name_offsets)),
+                ("torrent_files_start", struct.pack("<%dI" % len(files_start), *files_start)),
+                ("file_lengths", struct.pack("<%dQ" % num_files, *file_lengths)),
+                ("file_paths", struct.pack("<%dI" % len(path_offsets), *path_offsets)),
+                ("categories", struct.pack("<%dI" % len(category_offsets), *category_offsets))]
+
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(snapshot_path) + ".",
+                                        dir=os.path.dirname(os.path.abspath(snapshot_path)))
+    try:
+        with os.fdopen(tmp_fd, "wb") as snapshot_file:
+            snapshot_file.write(header)
+            for name, data in sections:
+                snapshot_file.write("\0" * (layout[name] - snapshot_file.tell()))
+                snapshot_file.write(data)
+            snapshot_file.write("\0" * (layout["heap"] - snapshot_file.tell()))
+            snapshot_file.write("".join(heap))
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, snapshot_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def is_snapshot_fresh(snapshot_path, torrents_path, torrent_files_path):
+    """
+    Returns whether the snapshot exists, has the current version and was compiled from the current source files.
+    """
+    if not os.path.isfile(snapshot_path):
+        return False
+
+    with open(snapshot_path, "rb") as snapshot_file:
+        header = snapshot_file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        return False
+
+    values = struct.unpack(HEADER_FORMAT, header)
+    if values[0] != SNAPSHOT_MAGIC or values[1] != SNAPSHOT_VERSION:
+        return False
+    return values[7:] == _get_fingerprint(torrents_path) + _get_fingerprint(torrent_files_path)
+
+
+class TorrentSnapshot(object):
+    """
+    A read-only, memory-mapped view on a compiled snapshot. Raises a ValueError if the file is not a complete
+    snapshot.
+    """
+
+    def __init__(self, snapshot_path):
+        with open(snapshot_path, "rb") as snapshot_file:
+            # Mapping an empty file raises a ValueError as well
+            self.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        values = struct.unpack_from(HEADER_FORMAT, self.mmap) if len(self.mmap) >= HEADER_SIZE else None
+        if values is None or values[0] != SNAPSHOT_MAGIC or values[1] != SNAPSHOT_VERSION:
+            self.mmap.close()
+            raise ValueError("%s is not a valid torrent snapshot" % snapshot_path)
+
+        self.num_torrents, self.num_files, self.num_categories, heap_size = values[3:7]
+        self.layout = _get_layout(self.num_torrents, self.num_files, self.num_categories)
+        self.heap_offset = self.layout["heap"]
+        if len(self.mmap) != self.heap_offset + heap_size:
+            self.mmap.close()
+            raise ValueError("%s is truncated" % snapshot_path)
+
+        category_offsets = self._read_column("categories", "I", self.num_categories + 1)
+        self.categories = [self._read_heap(category_offsets[i], category_offsets[i + 1])
+                           for i in xrange(self.num_categories)]
+
+    def __len__(self):
+        return self.num_torrents
+
+    def _read_column(self, section, type_code, count, start=0):
+        size = struct.calcsize(type_code)
+        return struct.unpack_from("<%d%s" % (count, type_code), self.mmap, self.layout[section] + start * size)
+
+    def _read_heap(self, start, end):
+        return self.mmap[self.heap_offset + start:self.heap_offset + end]
+
+    def iter_torrents(self):
+        """
+        Yields (id, hex infohash, name, length, category) tuples for all torrents in the snapshot.
+        """
+        count = self.num_torrents
+        ids = self._read_column("torrent_ids", "I", count)
+        lengths = self._read_column("torrent_lengths", "Q", count)
+        categories = self._read_column("torrent_categories", "B", count)
+        name_offsets = self._read_column("torrent_names", "I", count + 1)
+        infohashes_offset = self.layout["torrent_infohashes"]
+        infohashes = binascii.hexlify(self.mmap[infohashes_offset:infohashes_offset + INFOHASH_SIZE * count])
+
+        for i in xrange(count):
+            yield (str(ids[i]), infohashes[2 * INFOHASH_SIZE * i:2 * INFOHASH_SIZE * (i + 1)],
+                   self._read_heap(name_offsets[i], name_offsets[i + 1]), lengths[i], self.categories[categories[i]])
+
+    def iter_torrent_ids(self):
+        """
+        Yields the ids of all torrents in the snapshot.
+        """
+        for torrent_id in self._read_column("torrent_ids", "I", self.num_torrents):
+            yield str(torrent_id)
+
+    def get_files(self, index):
+        """
+        Returns the files of the torrent at the given index in the snapshot.
+        """
+        start, end = self._read_column("torrent_files_start", "I", 2, start=index)
+        if start == end:
+            return []
+
+        lengths = self._read_column("file_lengths", "Q", end - start, start=start)
+        path_offsets = self._read_column("file_paths", "I", end - start + 1, start=start)
+        return [{"path": self._read_heap(path_offsets[i], path_offsets[i + 1]), "length": lengths[i]}
+                for i in xrange(end - start)]
+
+    def close(self):
+        self.mmap.close()
+
+
+def load_snapshot(torrents_path=None, torrent_files_path=None, snapshot_path=None):
+    """
+    Loads the snapshot, compiling it first if it does not exist or if the source files have changed. A snapshot that
+    turns out to be corrupt is compiled again.
+    """
+    default_torrents_path, default_torrent_files_path, default_snapshot_path = get_default_paths()
+    torrents_path = torrents_path or default_torrents_path
+    torrent_files_path = torrent_files_path or default_torrent_files_path
+    snapshot_path = snapshot_path or default_snapshot_path
+
+    if is_snapshot_fresh(snapshot_path, torrents_path, torrent_files_path):
+        try:
+            return TorrentSnapshot(snapshot_path)
+        except ValueError:
+            pass
+    compile_snapshot(torrents_path, torrent_files_path, snapshot_path)
+    return TorrentSnapshot(snapshot_path)
+
+
+if __name__ == "__main__":
+    compile_snapshot(*get_default_paths())
+    print "Compiled torrent snapshot to %s" % get_default_paths()[2]
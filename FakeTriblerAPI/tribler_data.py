@@ -1,12 +1,25 @@
+from array import array
+import binascii
+from collections import OrderedDict
+import gc
+from operator import attrgetter
 import os
-from random import randint, sample
+import struct
+from random import getrandbits, randint, sample, seed
 from time import time
 
 import FakeTriblerAPI
+from FakeTriblerAPI.completion_index import CompletionIndex
+from FakeTriblerAPI.download_simulation import DownloadSimulation
 from FakeTriblerAPI.models.trustchain_block import TrustchainBlock
 from FakeTriblerAPI.models.order import Order
 from FakeTriblerAPI.models.tick import Tick
 from FakeTriblerAPI.models.transaction import Transaction
+from FakeTriblerAPI.profiles import get_profile, get_profile_name, get_seed
+from FakeTriblerAPI.search_index import SearchIndex
+from FakeTriblerAPI.torrent_files_index import DatTorrentFilesIndex, SnapshotTorrentFilesIndex
+from FakeTriblerAPI.torrent_snapshot import load_snapshot
+from FakeTriblerAPI.utils import get_random_hex_string
 from FakeTriblerAPI.utils.network import get_random_port
 from models.channel import Channel
 from models.download import Download
@@ -15,39 +28,112 @@ from models.tunnel import Circuit, Relay, Exit
 
 
 CREATE_MY_CHANNEL = True
+USE_TORRENT_SNAPSHOT = True
+# The maximum number of torrents of which the files are kept in memory, None means unbounded
+TORRENT_FILES_CACHE_SIZE = None
+# The maximum number of sorted views on the torrents of a channel that are kept in memory
+CHANNEL_TORRENTS_ORDERS_CACHE_SIZE = 1000
+
+# The collections that have a version, which is increased whenever the collection changes
+VERSIONED_COLLECTIONS = ("channels", "subscribed_channels", "settings", "trustchain_blocks")
+
+# The keys by which the channels and the torrents in a channel can be sorted
+CHANNEL_SORT_KEYS = {
+    "votes": attrgetter("votes"),
+    "relevance_score": attrgetter("relevance_score"),
+    "modified": attrgetter("modified"),
+    "name": lambda channel: channel.name.lower(),
+    "size": lambda channel: len(channel.torrents),
+}
+TORRENT_SORT_KEYS = {
+    "relevance_score": attrgetter("relevance_score"),
+    "modified": attrgetter("time_added"),
+    "name": lambda torrent: torrent.name.lower(),
+    "size": attrgetter("length"),
+    "num_seeders": attrgetter("num_seeders"),
+}
 
 
 class TriblerData:
 
-    def __init__(self):
+    def __init__(self, profile=None, seed=None):
+        self.profile_name = get_profile_name(profile)
+        self.profile = get_profile(self.profile_name)
+        self.seed = get_seed(seed)
         self.channels = []
+        self.channels_by_cid = {}
+        self.channels_by_id = {}
+        self.channel_orders = {}
+        self.channel_torrents_orders = OrderedDict()
         self.torrents = []
-        self.torrent_files = {}
+        self.torrent_indices = {}
+        self.torrent_files = None
+        self.torrent_search_index = SearchIndex()
+        self.channel_search_index = SearchIndex()
+        self.completion_index = CompletionIndex({})
         self.subscribed_channels = set()
         self.downloads = []
+        self.downloads_by_infohash = {}
+        self.download_simulation = DownloadSimulation()
         self.my_channel = -1
         self.rss_feeds = []
         self.settings = {}
         self.trustchain_blocks = []
         self.order_book = {}
         self.transactions = []
+        self.transactions_by_id = {}
         self.orders = []
         self.video_player_port = get_random_port()
+        # The versions are combined with a random instance id into entity tags, so tags from another run never match
+        self.instance_id = binascii.hexlify(os.urandom(4))
+        self.versions = dict((collection, 0) for collection in VERSIONED_COLLECTIONS)
+
+    def bump_version(self, *collections):
+        for collection in collections:
+            self.versions[collection] += 1
+
+    def get_etag(self, collection):
+        """
+        Returns the entity tag of the current version of the given collection.
+        """
+        return '"%s-%s-%d"' % (self.instance_id, collection, self.versions[collection])
+
+    def pick_size(self, name):
+        """
+        Returns a random size within the range of the current profile for the given kind of entity.
+        """
+        return randint(*self.profile[name])
 
     def generate(self):
-        self.read_torrent_files()
-        self.generate_torrents()
-        self.generate_channels()
-        self.assign_subscribed_channels()
-        self.generate_downloads()
-        self.generate_rss_feeds()
-        self.generate_trustchain_blocks()
-        self.generate_order_book()
-        self.generate_transactions()
-        self.generate_orders()
-        self.generate_dht_stats()
-        self.generate_tunnels()
+        seed(self.seed)
 
+        # Generation creates millions of objects without reference cycles at the larger profiles. Pausing the
+        # garbage collector avoids repeatedly scanning all of them.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.load_torrents()
+            self.generate_synthetic_torrents()
+            self.index_torrents()
+            self.generate_channels()
+            self.assign_subscribed_channels()
+            self.generate_downloads()
+            self.generate_rss_feeds()
+            self.generate_trustchain_blocks()
+            self.generate_order_book()
+            self.generate_transactions()
+            self.generate_orders()
+            self.generate_dht_stats()
+            self.generate_tunnels()
+            self.generate_settings()
+        finally:
+            if gc_enabled:
+                # Collect once now, otherwise the first full collection over all generated objects is paid by the
+                # first request
+                gc.collect()
+                gc.enable()
+
+    def generate_settings(self):
         # Create settings
         self.settings = {
             "settings": {
@@ -117,32 +203,48 @@ class TriblerData:
 
     # Generate channels from the random_channels file
     def generate_channels(self):
-        num_channels = randint(100, 200)
+        num_channels = self.pick_size("channels")
         for i in range(0, num_channels):
-            self.channels.append(Channel(i, name="Channel %d" % i, description="Description of channel %d" % i))
+            self.add_channel(Channel(i, name="Channel %d" % i, description="Description of channel %d" % i))
 
         if CREATE_MY_CHANNEL:
             # Pick one of these channels as your channel
             self.my_channel = randint(0, len(self.channels) - 1)
 
     def assign_subscribed_channels(self):
-        # Make between 10 and 50 channels subscribed channels
-        num_subscribed = randint(10, 50)
+        num_subscribed = self.pick_size("subscribed_channels")
         for i in range(0, num_subscribed):
             channel_index = randint(0, len(self.channels) - 1)
             self.subscribed_channels.add(channel_index)
             self.channels[channel_index].subscribed = True
 
+    def load_torrents(self):
+        """
+        Load the torrent corpus from the compiled snapshot. Fall back to parsing the .dat files when the snapshot
+        cannot be (re)built, for instance when the data directory is read-only and holds a corrupt snapshot.
+        """
+        if USE_TORRENT_SNAPSHOT:
+            try:
+                snapshot = load_snapshot()
+            except (IOError, OSError, ValueError, struct.error):
+                pass
+            else:
+                self.load_torrents_from_snapshot(snapshot)
+                return
+
+        self.read_torrent_files()
+        self.generate_torrents()
+
+    def load_torrents_from_snapshot(self, snapshot):
+        # The snapshot stays mapped, the files of a torrent are read from it on first access
+        self.torrent_files = SnapshotTorrentFilesIndex(snapshot, cache_size=TORRENT_FILES_CACHE_SIZE)
+        for torrent_parts in snapshot.iter_torrents():
+            self.torrents.append(Torrent(*torrent_parts))
+
     def read_torrent_files(self):
-        with open(os.path.join(os.path.dirname(FakeTriblerAPI.__file__), "data", "torrent_files.dat")) \
-                as torrent_files_file:
-            content = torrent_files_file.readlines()
-            for torrent_file_line in content:
-                parts = torrent_file_line.split("\t")
-                torrent_id = parts[0]
-                if torrent_id not in self.torrent_files:
-                    self.torrent_files[torrent_id] = []
-                self.torrent_files[torrent_id].append({"path": parts[1], "length": parts[2]})
+        self.torrent_files = DatTorrentFilesIndex(os.path.join(os.path.dirname(FakeTriblerAPI.__file__), "data",
+                                                               "torrent_files.dat"),
+                                                  cache_size=TORRENT_FILES_CACHE_SIZE)
 
     def generate_torrents(self):
         # Create random torrents in channels
@@ -152,24 +254,110 @@ class TriblerData:
             for random_torrent in content:
                 random_torrent = random_torrent.rstrip()
                 torrent_parts = random_torrent.split("\t")
-                torrent = Torrent(*torrent_parts)
-                if torrent_parts[0] in self.torrent_files:
-                    torrent.files = self.torrent_files[torrent_parts[0]]
-                self.torrents.append(torrent)
+                torrent_parts[1] = binascii.a2b_base64(torrent_parts[1]).encode('hex')
+                self.torrents.append(Torrent(*torrent_parts))
+
+    def generate_synthetic_torrents(self):
+        """
+        Grow the corpus to the number of torrents in the profile by duplicating corpus torrents with a new infohash.
+        The duplicates keep the id of the original torrent so they share its files.
+        """
+        num_torrents = self.profile["torrents"]
+        if num_torrents is None:
+            return
+
+        corpus = self.torrents[:num_torrents]
+        self.torrents = corpus
+        for i in xrange(num_torrents - len(corpus)):
+            original = corpus[i % len(corpus)]
+            self.torrents.append(Torrent(original.id, '%040x' % getrandbits(160), original.name, original.length,
+                                         original.category))
+
+    def index_torrents(self):
+        self.torrent_indices = dict((torrent.infohash, index) for index, torrent in enumerate(self.torrents))
+        self.torrent_search_index.add_documents(torrent.name for torrent in self.torrents)
+        self.completion_index = CompletionIndex(self.torrent_search_index.document_frequencies)
+
+    def get_torrent_index(self, infohash):
+        return self.torrent_indices.get(infohash)
 
     def generate_rss_feeds(self):
-        for i in range(randint(10, 30)):
+        for i in range(self.pick_size("rss_feeds")):
             self.rss_feeds.append('http://test%d.com/feed.xml' % i)
 
+    @staticmethod
+    def get_channel_search_text(channel):
+        return channel.name + " " + channel.description
+
+    def add_channel(self, channel):
+        self.channels.append(channel)
+        self.channels_by_cid.setdefault(channel.cid, channel)
+        self.channels_by_id.setdefault(str(channel.id), channel)
+        self.channel_search_index.add_document(len(self.channels) - 1, self.get_channel_search_text(channel))
+        self.channel_orders.clear()
+        self.bump_version("channels")
+
+    def edit_channel(self, channel, name, description):
+        """
+        Changes the name and description of the given channel and updates the search index accordingly.
+        """
+        index = self.channels.index(channel)
+        self.channel_search_index.remove_document(index, self.get_channel_search_text(channel))
+        channel.name = name
+        channel.description = description
+        self.channel_search_index.add_document(index, self.get_channel_search_text(channel))
+        self.channel_orders.clear()
+        self.bump_version("channels")
+        if channel.subscribed:
+            self.bump_version("subscribed_channels")
+
+    def subscribe_channel(self, channel):
+        self.subscribed_channels.add(channel.id)
+        channel.subscribed = True
+        self.bump_version("channels", "subscribed_channels")
+
+    def unsubscribe_channel(self, channel):
+        self.subscribed_channels.discard(channel.id)
+        channel.subscribed = False
+        self.bump_version("channels", "subscribed_channels")
+
+    def get_sorted_channels(self, sort_by):
+        """
+        Returns the indices of all channels in ascending order of the given sort key. The order is kept until a
+        channel is added or edited.
+        """
+        order = self.channel_orders.get(sort_by)
+        if order is None:
+            keys = map(CHANNEL_SORT_KEYS[sort_by], self.channels)
+            order = array('I', sorted(xrange(len(keys)), key=keys.__getitem__))
+            self.channel_orders[sort_by] = order
+        return order
+
+    def get_sorted_channel_torrents(self, channel, sort_by=None, family_filter=False):
+        """
+        Returns the indices of the torrents in the given channel in ascending order of the given sort key, or in the
+        order of the channel if no sort key is given. If the family filter is set, xxx torrents are left out.
+        """
+        cache_key = (channel.id, sort_by, family_filter)
+        order = self.channel_torrents_orders.pop(cache_key, None)
+        if order is None:
+            torrents = self.torrents
+            order = channel.torrents
+            if family_filter:
+                order = array('I', [index for index in order if torrents[index].category != 'xxx'])
+            if sort_by is not None:
+                keys = dict((index, TORRENT_SORT_KEYS[sort_by](torrents[index])) for index in order)
+                order = array('I', sorted(order, key=keys.__getitem__))
+            if len(self.channel_torrents_orders) >= CHANNEL_TORRENTS_ORDERS_CACHE_SIZE:
+                self.channel_torrents_orders.popitem(last=False)
+        self.channel_torrents_orders[cache_key] = order
+        return order
+
     def get_channel_with_id(self, id):
-        for channel in self.channels:
-            if str(channel.id) == id:
-                return channel
+        return self.channels_by_id.get(id)
 
     def get_channel_with_cid(self, cid):
-        for channel in self.channels:
-            if str(channel.cid) == cid:
-                return channel
+        return self.channels_by_cid.get(cid)
 
     def get_my_channel(self):
         if self.my_channel == -1:
@@ -177,54 +365,68 @@ class TriblerData:
         return self.channels[self.my_channel]
 
     def get_download_with_infohash(self, infohash):
-        for download in self.downloads:
-            if download.torrent.infohash == infohash:
-                return download
+        return self.downloads_by_infohash.get(infohash)
+
+    def add_download(self, download):
+        self.downloads.append(download)
+        self.downloads_by_infohash.setdefault(download.torrent.infohash, download)
+
+    def remove_download(self, download):
+        self.downloads.remove(download)
+        self.download_simulation.remove_row(download.row)
+        infohash = download.torrent.infohash
+        if self.downloads_by_infohash.get(infohash) is download:
+            del self.downloads_by_infohash[infohash]
+            for other_download in self.downloads:
+                if other_download.torrent.infohash == infohash:
+                    self.downloads_by_infohash[infohash] = other_download
+                    break
 
     def start_random_download(self):
         random_torrent = sample(self.torrents, 1)[0]
-        self.downloads.append(Download(random_torrent))
+        self.add_download(Download(random_torrent, self.download_simulation))
 
     def generate_downloads(self):
-        for _ in xrange(randint(10, 30)):
+        for _ in xrange(self.pick_size("downloads")):
             self.start_random_download()
 
     def generate_trustchain_blocks(self):
-        # Generate a chain of 100 blocks
+        # Generate a chain of blocks, one block per day
+        num_blocks = self.pick_size("trustchain_blocks")
         my_id = 'a' * 20
-        cur_timestamp = time() - 100 * 24 * 3600  # 100 days in the past
+        cur_timestamp = time() - num_blocks * 24 * 3600
         self.trustchain_blocks.append(TrustchainBlock(my_id=my_id, timestamp=cur_timestamp))
-        for i in xrange(100):
+        for i in xrange(num_blocks):
             cur_timestamp += 24 * 3600
             self.trustchain_blocks.append(TrustchainBlock(my_id=my_id, timestamp=cur_timestamp, last_block=
                                                           self.trustchain_blocks[-1]))
 
     def generate_order_book(self):
         # Generate some ask/bid ticks
-        ask_ticks = [Tick('DUM1', 'DUM2', is_ask=True) for _ in xrange(randint(20, 50))]
-        bid_ticks = [Tick('DUM1', 'DUM2', is_ask=False) for _ in xrange(randint(20, 50))]
+        ask_ticks = [Tick('DUM1', 'DUM2', is_ask=True) for _ in xrange(self.pick_size("ticks"))]
+        bid_ticks = [Tick('DUM1', 'DUM2', is_ask=False) for _ in xrange(self.pick_size("ticks"))]
         self.order_book = {'asks': ask_ticks, 'bids': bid_ticks}
 
     def get_transaction(self, trader_id, tx_number):
-        for transaction in self.transactions:
-            if transaction.trader_id == trader_id and transaction.transaction_number == tx_number:
-                return transaction
+        return self.transactions_by_id.get((trader_id, tx_number))
 
     def generate_transactions(self):
-        self.transactions = [Transaction('DUM1', 'DUM2') for _ in xrange(randint(20, 50))]
+        self.transactions = [Transaction('DUM1', 'DUM2') for _ in xrange(self.pick_size("transactions"))]
+        for transaction in self.transactions:
+            self.transactions_by_id.setdefault((transaction.trader_id, transaction.transaction_number), transaction)
 
     def generate_orders(self):
-        self.orders = [Order('DUM1', 'DUM2') for _ in xrange(randint(20, 50))]
+        self.orders = [Order('DUM1', 'DUM2') for _ in xrange(self.pick_size("orders"))]
 
     def generate_dht_stats(self):
         self.dht_stats = {
             "num_tokens": randint(10, 50),
             "routing_table_buckets": randint(1, 10),
             "num_keys_in_store": randint(100, 500),
-            "num_store_for_me": {os.urandom(20).encode('hex'): randint(1, 8)},
+            "num_store_for_me": {get_random_hex_string(40): randint(1, 8)},
             "num_peers_in_store": {},
-            "node_id": os.urandom(20).encode('hex'),
-            "peer_id": os.urandom(20).encode('hex'),
+            "node_id": get_random_hex_string(40),
+            "peer_id": get_random_hex_string(40),
             "routing_table_size": randint(10, 50)
 	    }
 
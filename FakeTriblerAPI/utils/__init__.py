@@ -1,5 +1,43 @@
+from itertools import imap
+import json
 import random
 
 
 def get_random_hex_string(len):
-   return ''.join([random.choice('0123456789abcdef') for x in range(len)])
+   return '%0*x' % (len, random.getrandbits(len * 4))
+
+
+def get_random_int(low, high):
+    """
+    Returns a random integer N such that low <= N <= high. This is considerably faster than random.randint, which
+    matters when generating millions of models.
+    """
+    return low + int(random.random() * (high - low + 1))
+
+
+def encode_json_fields(**fields):
+    """
+    Returns the JSON encoding of the given fields as they follow the list in encode_json_list.
+    """
+    return "".join(', "%s": %s' % (name, json.dumps(value)) for name, value in sorted(fields.iteritems()))
+
+
+def encode_json_list(key, fragments, **fields):
+    """
+    Returns the JSON encoding of a dictionary that maps the given key to a list of already encoded JSON fragments,
+    together with the given additional fields.
+    """
+    return '{"%s": [%s]%s}' % (key, ", ".join(fragments), encode_json_fields(**fields))
+
+
+def iter_page(order, first, last, descending=False):
+    """
+    Returns an iterator over the items at the 1-based positions first up to and including last of the given order, or
+    of the reversed order if descending is set. Only the items on the page are visited, so the order can also be an
+    xrange.
+    """
+    first = max(first, 1)
+    last = min(last, len(order))
+    if descending:
+        return imap(order.__getitem__, xrange(len(order) - first, len(order) - last - 1, -1))
+    return imap(order.__getitem__, xrange(first - 1, last))
@@ -0,0 +1,163 @@
+"""
+Starts the fake Tribler API.
+
+The size of the generated data is determined by a scale profile, see FakeTriblerAPI/profiles.py.
+
+With --workers N, the data is generated once and N worker processes are forked that serve the same listening sockets.
+The kernel spreads the connections over the workers. The generated data is shared copy-on-write by the workers,
+although pages with Python objects do get copied when a worker touches the reference counts of their objects.
+Every worker keeps its own copy of the state that changes at runtime: subscriptions, settings, downloads and their
+simulation, and the events stream. A client only sees its own changes when it talks to the same worker, which is the
+case as long as it reuses its connection, so tests that depend on changes across connections should use one worker.
+When one worker stops, for instance through the shutdown endpoint, the other workers are stopped as well.
+"""
+import argparse
+import binascii
+import errno
+import os
+import random
+import signal
+import socket
+import sys
+import traceback
+
+import FakeTriblerAPI.tribler_utils as tribler_utils
+from FakeTriblerAPI.download_simulation import TICK_INTERVAL
+from FakeTriblerAPI.profiles import PROFILES
+from FakeTriblerAPI.resource_monitor import SAMPLE_INTERVAL
+from FakeTriblerAPI.shaping import Shaping
+from FakeTriblerAPI.tribler_data import TriblerData
+
+# The maximum number of pending connections on the listening sockets
+LISTEN_BACKLOG = 1024
+
+
+def generate_tribler_data(profile=None, seed=None):
+    tribler_utils.tribler_data = TriblerData(profile=profile, seed=seed)
+    tribler_utils.tribler_data.generate()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the fake Tribler API")
+    parser.add_argument("--port", type=int, default=8085, help="the port of the REST API")
+    parser.add_argument("--profile", choices=sorted(PROFILES),
+                        help="the scale profile of the generated data (default: $FAKE_TRIBLER_PROFILE or default)")
+    parser.add_argument("--seed", type=int, help="the random seed (default: $FAKE_TRIBLER_SEED or a fixed seed)")
+    parser.add_argument("--tick-interval", type=float, default=TICK_INTERVAL,
+                        help="the number of seconds between two steps of the download simulation, 0 disables it")
+    parser.add_argument("--resource-monitor-interval", type=float, default=0,
+                        help="the number of seconds between two samples of the CPU and memory use of the fake API, "
+                             "which are served as the CPU and memory history (default: 0, which disables sampling; "
+                             "%s is a sensible interval)" % SAMPLE_INTERVAL)
+    parser.add_argument("--shaping", help="a JSON file with the delays and bandwidth caps of the API routes, see "
+                                          "FakeTriblerAPI/shaping.py")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="the number of worker processes that share the generated data (default: 1)")
+    return parser.parse_args()
+
+
+def create_listening_socket(port):
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind(("", port))
+    listening_socket.listen(LISTEN_BACKLOG)
+    listening_socket.setblocking(False)
+    return listening_socket
+
+
+def run_server(api_socket, video_socket, tick_interval, resource_monitor_interval=0, shaping=None):
+    """
+    Serves the given listening sockets until the reactor stops. The API responses are shaped by the given shaping, if
+    any.
+    """
+    # The reactor is only installed here, since its poller can not be shared by forked workers
+    from twisted.internet import reactor
+    from twisted.web.server import Site
+
+    from FakeTriblerAPI.endpoints.root_endpoint import RootEndpoint
+    from FakeTriblerAPI.endpoints.video_root_endpoint import VideoRootEndpoint
+    from FakeTriblerAPI.metrics import MetricsSite
+    from FakeTriblerAPI.shaping import ShapedSite
+
+    api_root = RootEndpoint()
+    api_site = ShapedSite(api_root, shaping, reactor) if shaping is not None else MetricsSite(api_root)
+    reactor.adoptStreamPort(api_socket.fileno(), socket.AF_INET, api_site)
+    reactor.adoptStreamPort(video_socket.fileno(), socket.AF_INET, Site(VideoRootEndpoint()))
+    api_socket.close()
+    video_socket.close()
+    if tick_interval > 0:
+        tribler_utils.tribler_data.download_simulation.start(tick_interval)
+    if resource_monitor_interval > 0:
+        api_root.resource_monitor.start(resource_monitor_interval)
+    reactor.run()
+
+
+def run_workers(num_workers, api_socket, video_socket, tick_interval, resource_monitor_interval=0, shaping=None):
+    """
+    Forks the given number of workers that serve the given listening sockets, and waits until they have stopped.
+    """
+    # Flush the output, otherwise every worker inherits a copy of it
+    sys.stdout.flush()
+
+    worker_pids = []
+    for worker_index in xrange(num_workers):
+        pid = os.fork()
+        if pid == 0:
+            # Let every worker simulate its downloads differently
+            random.seed(tribler_utils.tribler_data.seed + worker_index + 1)
+            # Every worker changes its collections independently, so it needs its own entity tags
+            tribler_utils.tribler_data.instance_id = binascii.hexlify(os.urandom(4))
+            # A worker never returns to the caller, its exit status tells the parent whether it failed
+            try:
+                run_server(api_socket, video_socket, tick_interval,
+                           resource_monitor_interval=resource_monitor_interval, shaping=shaping)
+            except Exception:
+                traceback.print_exc()
+                sys.stderr.flush()
+                os._exit(1)
+            sys.stdout.flush()
+            os._exit(0)
+        worker_pids.append(pid)
+    api_socket.close()
+    video_socket.close()
+
+    def stop_workers(*_):
+        for worker_pid in worker_pids:
+            try:
+                os.kill(worker_pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while worker_pids:
+        try:
+            pid, status = os.wait()
+        except OSError as error:
+            if error.errno == errno.EINTR:
+                continue
+            raise
+        worker_pids.remove(pid)
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) != 0:
+            print >> sys.stderr, "Worker %d failed with exit status %d" % (pid, os.WEXITSTATUS(status))
+        stop_workers()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    shaping = Shaping.from_file(args.shaping) if args.shaping else None
+    generate_tribler_data(profile=args.profile, seed=args.seed)
+
+    api_socket = create_listening_socket(args.port)
+    video_socket = create_listening_socket(tribler_utils.tribler_data.video_player_port)
+
+    print "Fake Tribler API (profile %s, seed %d) listening on port %d" % \
+          (tribler_utils.tribler_data.profile_name, tribler_utils.tribler_data.seed, args.port)
+    if args.workers > 1:
+        print "Serving with %d workers" % args.workers
+        run_workers(args.workers, api_socket, video_socket, args.tick_interval,
+                    resource_monitor_interval=args.resource_monitor_interval, shaping=shaping)
+    else:
+        run_server(api_socket, video_socket, args.tick_interval,
+                   resource_monitor_interval=args.resource_monitor_interval, shaping=shaping)